@@ -0,0 +1,156 @@
+# Estenopeica-control
+# Several pinhole cameras on one esp32.
+#
+# Each camera has its servo (the pin, and the pulses with the pinhole closed
+# and open), its schedule, its exposure and its feeds, see CAMERAS in
+# config.py. What the program remembers of each one (the last picture, the
+# exposure in progress) is kept by program.py in the state, by the index of
+# the camera.
+#
+# A servo draws a lot of current while it moves, so only one moves at a
+# time: the moves wait in a queue (move()) and all the servos share the
+# same step timer. The exposures are timed by one hardware timer, armed for
+# the next camera that has to close, so the cameras can be open at the
+# same time.
+#
+# Usage:
+#   cams = [cameras.Camera(config) for config in CAMERAS]
+#   cameras.expose(cams[0], 120, done)
+
+import time
+from machine import Timer
+import servoctl
+
+# Hardware timers of the moves and of the exposures
+STEP_TIMER = 1
+SHUTTER_TIMER = 0
+
+
+class Camera:
+    def __init__(self, config, position=None):
+        self.name = config['name']
+        self.pin = config['pin']
+        self.closed = config['closed']
+        self.open = config['open']
+        self.schedules = config['schedules']
+        self.open_time = config['open_time']
+        self.feed = config['feed']
+        self.exposure_feed = config['exposure_feed']
+        self.servo = servoctl.Servo(self.pin, position, STEP_TIMER)
+        # Of the exposure in progress, in ticks_ms: when the opening move
+        # started, when it has to close and when the closing move started.
+        self.opened = None
+        self.closes = None
+        self.closed_at = None
+        # Called when the pinhole is closed again and the servo still
+        self.done = None
+
+    def exposure(self):
+        """
+        Milliseconds it was open in the last exposure, from the start of the
+        opening move to the start of the closing one
+        """
+        return time.ticks_diff(self.closed_at, self.opened)
+
+
+# Moves waiting, (camera, target pulse, started, done), and the camera moving
+queue = []
+moving = None
+# Cameras with the pinhole open
+exposing = []
+shutter_timer = None
+
+
+def move(camera, target, started=None, done=None):
+    """
+    Move the servo of a camera when the others are still. started() is
+    called when it starts to move, done() when it is still again
+    """
+    queue.append((camera, target, started, done))
+    if moving is None:
+        next_move()
+
+
+def next_move():
+    """
+    Start the next move of the queue
+    """
+    global moving
+    if not queue:
+        moving = None
+        return
+    camera, target, started, done = queue.pop(0)
+    moving = camera
+    if started:
+        started()
+    camera.servo.move(target, lambda: moved(done))
+
+
+def moved(done):
+    """
+    A servo got to its target
+    """
+    if done:
+        done()
+    next_move()
+
+
+def wait():
+    """
+    Wait until all the servos are still
+    """
+    while moving is not None:
+        time.sleep_ms(servoctl.STEP_MS)
+
+
+def expose(camera, seconds, done):
+    """
+    Open the pinhole of a camera for some seconds. It does not wait, done()
+    is called when the pinhole is closed again and the servo still
+    """
+    camera.done = done
+    camera.closed_at = None
+
+    def started():
+        # The exposure counts from the start of the move, that may have
+        # waited for another servo
+        camera.opened = time.ticks_ms()
+        camera.closes = time.ticks_add(camera.opened, seconds * 1000)
+        exposing.append(camera)
+        arm()
+
+    move(camera, camera.open, started)
+
+
+def arm():
+    """
+    Set the shutter timer for the next camera that has to close
+    """
+    global shutter_timer
+    if shutter_timer is None:
+        shutter_timer = Timer(SHUTTER_TIMER)
+    if not exposing:
+        shutter_timer.deinit()
+        return
+    now = time.ticks_ms()
+    wait_ms = min(time.ticks_diff(camera.closes, now) for camera in exposing)
+    shutter_timer.init(mode=Timer.ONE_SHOT, period=max(wait_ms, 1), callback=close_due)
+
+
+def close_due(timer):
+    """
+    Called by the shutter timer. Close the cameras whose time is up
+    """
+    now = time.ticks_ms()
+    for camera in exposing[:]:
+        if time.ticks_diff(camera.closes, now) <= 0:
+            exposing.remove(camera)
+            move(camera, camera.closed, lambda camera=camera: closing(camera), camera.done)
+    arm()
+
+
+def closing(camera):
+    """
+    The closing move of a camera started
+    """
+    camera.closed_at = time.ticks_ms()
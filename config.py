@@ -0,0 +1,143 @@
+# Estenopeica-control
+# Settings of the program. Change them here and copy the programs again, see
+# To program in README.md. They are compiled with the rest, so a wake up does
+# not parse them.
+
+# Configuration of the pins of the sensor. Looking at the heltec
+# if the display is looking away from your eyes
+# Pin GND: Is the first pin from the top right. The white cable without ribon
+# Pin 5v: Is the second pin from the top right. The while cable WITH ribon
+# Pin data: Is pin numbered 33 in the board. the eleventh pin from top right
+
+#
+# Times configuration
+#
+# Day of opening for picture. 6 for sunday, 5 for saturday, 4 friday, 3 thursday, 2 wednesday, 1 tuesday, 0 monday, -10 for every day
+day_of_opening = -10
+# Hour of opening (24hs)
+hour_of_opening = 12
+# Openings of the pinhole. See schedule.py for all the options, like several
+# days of the week, several times per day or every N days. By default, the
+# day_of_opening and hour_of_opening above.
+SCHEDULES = (
+    {'weekdays': None if day_of_opening == -10 else (day_of_opening,),
+     'times': ((hour_of_opening, 0, 0),)},
+)
+# An opening is still taken if we are late for it less than this many seconds
+OPENING_GRACE = 3600
+# Set pinhole open time. 60 seconds = 1 minute
+PINHOLE_OPEN_TIME = 120
+# Where the camera is, in degrees (south and west are negative), for the
+# altitude of the sun at the openings. Buenos Aires
+LATITUDE = -34.6
+LONGITUDE = -58.4
+# PINHOLE_OPEN_TIME (and the open time of each camera) is the right exposure
+# with the sun at REFERENCE_ALTITUDE degrees. With the table of the sun in
+# the flash (see ephemeris.py) each exposure follows the sun of its day,
+# from EXPOSURE_MIN to EXPOSURE_MAX seconds. Without it they all are the
+# open time
+REFERENCE_ALTITUDE = 45
+EXPOSURE_MIN = 30
+EXPOSURE_MAX = 600
+# Pin of the servo, and its pulse (ns) with the pinhole closed and open.
+# First border is 200000, last border is 1370000. See servoctl.py for how
+# fast it moves
+SERVO_PIN = 17
+PULSE_CLOSED = 684000
+PULSE_OPEN = 1114000
+# -3 is buenos aires, argentina
+UTC_OFFSET = -3 * 60 * 60
+# Time between the humidity reports
+REPORT_PERIOD = 3600
+# Between checks, put the esp32 in deep sleep instead of waiting awake with
+# time.sleep(). The state of the loop is kept in RTC memory while sleeping.
+DEEP_SLEEP = True
+# If we wake up this close (seconds) to the next thing to do, do not go back to sleep
+WAKE_MARGIN = 5
+# While awake, read the humidity every this many seconds
+SENSOR_PERIOD = 60
+# Each humidity reading is the mean of this many samples, without the
+# HUM_TRIM lowest and highest, averaged with the previous readings with a
+# weight of 1 / 2**HUM_EMA_SHIFT. See humidity.py
+HUM_SAMPLES = 32
+HUM_TRIM = 8
+HUM_EMA_SHIFT = 2
+# Keepalive of the mqtt connection. A ping is sent every half of it
+MQTT_KEEPALIVE = 120
+# Show the splash screens and pause between the setup steps, to follow them
+# in the display. Otherwise the boot goes as fast as it can
+DEBUG = False
+# When not using deep sleep, send the buffered telemetry every this many seconds.
+# With deep sleep it is sent once per wake up, before sleeping.
+TELEMETRY_PERIOD = 300
+
+#
+# Adafruit IO configuration
+#
+ADAFRUIT_IO_URL = b'io.adafruit.com'
+ADAFRUIT_USERNAME = b'eldraco'
+# The telemetry is published to a group, so one message carries all the feeds
+ADAFRUIT_IO_GROUP = b'default'
+# Keys of the feeds
+FEED_HUM = 'sensor1-hum'
+# Range of the humidity samples of a reading
+FEED_HUM_SPREAD = 'sensor1-hum-spread'
+FEED_PINHOLE = 'pinhole'
+FEED_WAITING = 'waitingtime'
+FEED_WIFI = 'wifi-ms'
+# Time from the start of the program to the start of the loop, and of the
+# last wake up that went back to sleep straight away, in ms
+FEED_BOOT = 'boot-ms'
+FEED_QUICK_WAKE = 'quick-wake-ms'
+# Measured open time of each picture, and the difference between the
+# longest and the shortest since the first boot (of the camera where it is
+# the largest), in ms
+FEED_EXPOSURE = 'exposure-ms'
+FEED_JITTER = 'exposure-jitter'
+# Times of the phases of the program, see phases.py
+FEED_DIAG = 'diag-phases'
+# Free memory and its fragmentation, see memstats.py
+FEED_DIAG_MEM = 'diag-mem'
+# Search the largest free block of the heap (for the fragmentation) at most
+# once in this many seconds, or always in DEBUG. The search allocates
+MEM_PROBE_PERIOD = 24 * 3600
+# Altitude of the sun at an opening, in degrees
+FEED_SUN = 'sun-altitude'
+# Cause of a reset that was not a wake up from deep sleep, see machine.reset_cause()
+FEED_RESET = 'reset-cause'
+# Feeds of diagnostics, of which only the latest sample is kept while the
+# telemetry can not be sent, so an outage leaves room for the measures
+FEEDS_LATEST = (FEED_DIAG, FEED_DIAG_MEM, FEED_BOOT, FEED_QUICK_WAKE, FEED_WAITING, FEED_WIFI)
+# When waking up from deep sleep, give up the WiFi after this many attempts
+# and keep the telemetry for the next wake up. At the first boot it tries
+# forever, since it needs the time from NTP.
+WIFI_ATTEMPTS = 3
+# Seconds that the WiFi, NTP and mqtt can take after a wake up. They block
+# the program while they connect, so they wait for the pictures that are
+# open or due in less than this
+JOIN_TIME = 60
+
+#
+# Cameras
+#
+# Each camera has the pin of its servo, the pulses (ns) of the servo with
+# the pinhole closed and open, its openings, its exposure in seconds (with
+# the sun at REFERENCE_ALTITUDE when there is the table of the sun), and the
+# feeds of its pinhole (1 open, 0 closed) and of its exposures in ms.
+# They all share the wake ups, the WiFi and mqtt. Only one servo moves at a
+# time, see cameras.py. Another camera looking elsewhere, for example:
+#   {'name': 'East', 'pin': 18, 'closed': 684000, 'open': 1114000,
+#    'schedules': SCHEDULES, 'open_time': 90,
+#    'feed': 'pinhole-east', 'exposure_feed': 'exposure-east-ms'},
+CAMERAS = (
+    {'name': 'Pinhole', 'pin': SERVO_PIN, 'closed': PULSE_CLOSED, 'open': PULSE_OPEN,
+     'schedules': SCHEDULES, 'open_time': PINHOLE_OPEN_TIME,
+     'feed': FEED_PINHOLE, 'exposure_feed': FEED_EXPOSURE},
+)
+# Reset the esp32 if the program is stuck for this many ms, see machine.WDT.
+# After a reset it goes on from the state in RTC memory
+WDT_TIMEOUT = 30000
+# An exposure cut by a reset counts if it missed at most this many seconds,
+# or if the opening is too old to finish it. Otherwise the pinhole opens
+# again only for the seconds it missed, so the picture is not exposed twice
+RESUME_MARGIN = 5
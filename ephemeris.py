@@ -0,0 +1,74 @@
+# Estenopeica-control
+# Exposure of each opening from the altitude of the sun.
+#
+# At the same hour the sun is much higher in summer than in winter, so a
+# fixed open time gives pictures too dark or too light along the year. The
+# altitude of the sun at the times of the schedule, and how much longer
+# than the reference the exposure has to be for it, are calculated on a
+# computer by sim/suntable.py for every day of the year and copied to the
+# flash as a small table. The esp32 only reads the record of the day, there
+# are no floats or trigonometry here.
+#
+# The table file (FILE) is:
+#   header: MAGIC, number of times of the day (uint8)
+#   the times of the day, seconds since midnight in local time (uint32 each)
+#   DAYS days of a leap year, for each time: altitude of the sun in
+#   hundredths of degree (int16) and the factor of the exposure in
+#   FACTOR_SCALE parts (uint16, at most FACTOR_MAX)
+# All little endian.
+
+import struct
+import time
+
+FILE = 'ephemeris.bin'
+MAGIC = b'SUN2'
+HEADER = '<4sB'
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD = '<hH'
+RECORD_SIZE = struct.calcsize(RECORD)
+DAYS = 366
+# The factor is exposure / reference exposure, times FACTOR_SCALE
+FACTOR_SCALE = 1000
+FACTOR_MAX = 0xffff
+
+
+def day_index(seconds):
+    """
+    Row of the table of a day (seconds, local time): the day of the year as
+    if it was a leap year, so the 1st of March is always the same row
+    """
+    t = time.gmtime(seconds)
+    year = t[0]
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    yearday = t[7] - 1
+    if not leap and yearday >= 59:
+        yearday += 1
+    return yearday
+
+
+def lookup(opening, path=FILE):
+    """
+    Altitude of the sun (hundredths of degree) and factor of the exposure
+    (FACTOR_SCALE parts) of an opening, in local seconds. None if there is
+    no table or it does not have the time of the opening
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[:4] != MAGIC:
+                return None
+            count = header[4]
+            times = f.read(4 * count)
+            if len(times) < 4 * count:
+                return None
+            times = struct.unpack('<{}I'.format(count), times)
+            second = opening % 86400
+            if second not in times:
+                return None
+            f.seek(HEADER_SIZE + 4 * count + (day_index(opening) * count + times.index(second)) * RECORD_SIZE)
+            record = f.read(RECORD_SIZE)
+    except OSError:
+        return None
+    if len(record) < RECORD_SIZE:
+        return None
+    return struct.unpack(RECORD, record)
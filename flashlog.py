@@ -0,0 +1,114 @@
+# Estenopeica-control
+# Log in the flash of what the camera did, that does not depend on the
+# network: the boots, the humidity reports and the exposures.
+#
+# Each event is a fixed record of RECORD_SIZE bytes (see RECORD). The records
+# are kept in a buffer and appended to the flash in one write when it is
+# full, or right away after an exposure. While sleeping the records not
+# written yet are kept in the state of the program in RTC memory (see
+# rtcstate.py), so a wake up does not write the flash at all.
+# The log is split in segment files of at most SEGMENT_SIZE bytes, and only
+# the last MAX_SEGMENTS are kept. sim/logreader.py reads them on a computer.
+#
+# The times are the ones of time.time(), in seconds since the epoch of the
+# port, 2000-01-01 in the esp32. Each segment starts with an EPOCH record,
+# whose time is the epoch in seconds since 1970-01-01, so the reader knows
+# how to convert them.
+
+import os
+import struct
+import time
+import ubinascii
+
+# Little endian: time (UTC seconds), event, extra, humidity, humidity spread,
+# exposure (ms), latency (ms)
+RECORD = '<IBBHHIH'
+RECORD_SIZE = struct.calcsize(RECORD)
+# Events. The time of an exposure is when it was scheduled, its latency how
+# late it opened. The latency of a report is how long the boot took, for
+# the first report of a wake up. The extra of a boot is the reset cause, of
+# an exposure the camera (its index times 2) plus 1 if a reset cut it
+BOOT = 1
+REPORT = 2
+EXPOSURE = 3
+EPOCH = 4
+# Records kept before writing them. They also go to the RTC memory
+BUFFER_RECORDS = 16
+# Size of a segment file, and how many are kept
+SEGMENT_SIZE = 4096 * RECORD_SIZE
+MAX_SEGMENTS = 8
+PREFIX = 'log-'
+SUFFIX = '.bin'
+
+
+def segment_name(index):
+    return '{}{:05d}{}'.format(PREFIX, index, SUFFIX)
+
+
+def epoch():
+    """
+    Seconds from 1970-01-01 to the epoch of time.time()
+    """
+    year = time.gmtime(0)[0]
+    return ((year - 1970) * 365 + (year - 1969) // 4) * 86400
+
+
+def segments():
+    """
+    Names of the segment files, the oldest first
+    """
+    return sorted(name for name in os.listdir() if name.startswith(PREFIX) and name.endswith(SUFFIX))
+
+
+class Log:
+    def __init__(self, state):
+        self.state = state
+        self.buffer = bytearray(BUFFER_RECORDS * RECORD_SIZE)
+        self.count = 0
+        # Records left in the RTC memory before the last sleep
+        pending = state.pop('log', None)
+        if pending:
+            data = ubinascii.unhexlify(pending)
+            self.buffer[:len(data)] = data
+            self.count = len(data) // RECORD_SIZE
+
+    def add(self, event, when, humidity=0, spread=0, exposure=0, latency=0, extra=0):
+        """
+        Add a record. Values out of the range of the record are clipped
+        """
+        struct.pack_into(RECORD, self.buffer, self.count * RECORD_SIZE, when, event, extra,
+                         min(max(humidity, 0), 0xffff), min(max(spread, 0), 0xffff),
+                         min(max(exposure, 0), 0xffffffff), min(max(latency, 0), 0xffff))
+        self.count += 1
+        if self.count == BUFFER_RECORDS:
+            self.flush()
+
+    def flush(self):
+        """
+        Append the records in the buffer to the last segment, starting a new
+        one if it is full
+        """
+        if not self.count:
+            return
+        size = self.count * RECORD_SIZE
+        names = segments()
+        if names and os.stat(names[-1])[6] + size <= SEGMENT_SIZE:
+            name = names[-1]
+        else:
+            index = int(names[-1][len(PREFIX):-len(SUFFIX)]) + 1 if names else 0
+            name = segment_name(index)
+            names.append(name)
+            while len(names) > MAX_SEGMENTS:
+                os.remove(names.pop(0))
+            with open(name, 'wb') as f:
+                f.write(struct.pack(RECORD, epoch(), EPOCH, 0, 0, 0, 0, 0))
+        with open(name, 'ab') as f:
+            f.write(memoryview(self.buffer)[:size])
+        self.count = 0
+
+    def save(self):
+        """
+        Keep the records not written in the state, before a deep sleep
+        """
+        if self.count:
+            self.state['log'] = ubinascii.hexlify(memoryview(self.buffer)[:self.count * RECORD_SIZE]).decode()
@@ -0,0 +1,79 @@
+# Estenopeica-control
+# Humidity readings with less noise.
+#
+# The ADC of the esp32 is noisy, so each reading is a burst of samples in a
+# fixed array. The samples are sorted in place, the lowest and highest
+# `trim` are dropped as outliers and the rest are averaged (a trimmed mean,
+# the median when trim leaves one or two). The spread is the range of the
+# samples kept.
+# The readings are also smoothed with an exponential moving average that is
+# kept in the state of the program (see rtcstate.py), so it goes on after
+# deep sleep. It is an integer with 4 bits of fraction, no floats.
+#
+# Nothing is allocated per sample, a reading takes a couple of milliseconds.
+
+import array
+from machine import ADC
+from machine import Pin
+
+# Samples per reading
+SAMPLES = 32
+# Samples dropped at each end. With a quarter, the mean of the middle half
+TRIM = 8
+# Weight of a new reading in the average, 1 / 2**EMA_SHIFT
+EMA_SHIFT = 2
+# Bits of fraction of the average
+EMA_FRACTION = 4
+
+
+class Sensor:
+    def __init__(self, pin, samples=SAMPLES, trim=TRIM, ema_shift=EMA_SHIFT):
+        if 2 * trim >= samples:
+            raise ValueError('trim leaves no samples')
+        self.adc = ADC(Pin(pin))
+        # Full range: 3.3v
+        self.adc.atten(ADC.ATTN_11DB)
+        self.samples = array.array('H', bytes(2 * samples))
+        self.trim = trim
+        self.ema_shift = ema_shift
+        # Of the last reading
+        self.value = 0
+        self.spread = 0
+
+    def read(self):
+        """
+        Read a burst of samples. Returns their trimmed mean
+        """
+        samples = self.samples
+        n = len(samples)
+        read = self.adc.read
+        for i in range(n):
+            samples[i] = read()
+        # Insertion sort, in place. The array is small
+        for i in range(1, n):
+            sample = samples[i]
+            j = i - 1
+            while j >= 0 and samples[j] > sample:
+                samples[j + 1] = samples[j]
+                j -= 1
+            samples[j + 1] = sample
+        total = 0
+        for i in range(self.trim, n - self.trim):
+            total += samples[i]
+        kept = n - 2 * self.trim
+        self.value = (total + kept // 2) // kept
+        self.spread = samples[n - self.trim - 1] - samples[self.trim]
+        return self.value
+
+    def smooth(self, state):
+        """
+        Add the last reading to the average kept in the state. Returns the average
+        """
+        value = self.value << EMA_FRACTION
+        ema = state.get('hum_ema')
+        if ema is None:
+            ema = value
+        else:
+            ema += (value - ema) >> self.ema_shift
+        state['hum_ema'] = ema
+        return (ema + (1 << (EMA_FRACTION - 1))) >> EMA_FRACTION
@@ -0,0 +1,70 @@
+# Estenopeica-control
+# State of the heap of MicroPython, for the diagnostics feed.
+#
+# A long running program can fragment the heap: there is memory free, but
+# not in one piece, until an allocation fails with MemoryError. The
+# fragmentation is measured as how much of the free memory is not in the
+# largest block that can be allocated.
+#
+# MicroPython can not tell the largest free block of its heap without
+# printing it, so it is searched by allocating trial blocks. That moves the
+# heap it measures, so it is only done when asked (probe), not at every
+# digest. The heap of the esp-idf under it (WiFi, sockets) is read from
+# esp32.idf_heap_info() without allocating, where there is one.
+
+import gc
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+# Resolution (bytes) of the search of the largest free block
+BLOCK_STEP = 256
+
+
+def largest_free():
+    """
+    Size of the largest block that can be allocated now, searched by halves.
+    Each trial block is collected before the next one
+    """
+    low = 0
+    high = gc.mem_free()
+    while high - low > BLOCK_STEP:
+        size = (low + high) // 2
+        try:
+            block = bytearray(size)
+            del block
+            low = size
+        except MemoryError:
+            high = size
+        gc.collect()
+    return low
+
+
+def idf_heap():
+    """
+    Free bytes and largest free block of the data heap of the esp-idf. None
+    if the port has no esp32 module
+    """
+    if esp32 is None:
+        return None
+    regions = esp32.idf_heap_info(esp32.HEAP_DATA)
+    return sum(region[1] for region in regions), max(region[2] for region in regions)
+
+
+def digest(probe=False):
+    """
+    Text with the free and allocated bytes, like 'free:83200 alloc:27904'.
+    With probe also the largest free block and the fragmentation, like
+    ' largest:61184 frag:26%', and with the esp-idf heap ' idf:41000/31744'
+    """
+    gc.collect()
+    free = gc.mem_free()
+    text = 'free:{} alloc:{}'.format(free, gc.mem_alloc())
+    if probe:
+        largest = largest_free()
+        text += ' largest:{} frag:{}%'.format(largest, 100 - largest * 100 // free if free else 0)
+    idf = idf_heap()
+    if idf:
+        text += ' idf:{}/{}'.format(*idf)
+    return text
@@ -0,0 +1,88 @@
+# Estenopeica-control
+# Timing of the phases of the program: WiFi, NTP, mqtt, the sensor, the
+# schedule, the display, the telemetry and the pictures.
+#
+# Each phase is measured with time.ticks_us() between start() and stop(),
+# and kept in a fixed table with the number of times, the minimum, the total
+# and the maximum. Nothing is allocated while measuring, so it can stay on
+# in the esp32. digest() gives a short text of the table to publish in the
+# diagnostics feed, and reset() starts a new cycle.
+#
+# Usage:
+#   started = phases.start()
+#   ...
+#   phases.stop(phases.WIFI, started)
+
+import time
+
+# Phases, index in the table
+WIFI = 0
+NTP = 1
+MQTT = 2
+SENSOR = 3
+SCHEDULE = 4
+DISPLAY = 5
+PUBLISH = 6
+PIC = 7
+NAMES = ('wifi', 'ntp', 'mqtt', 'sensor', 'schedule', 'display', 'publish', 'pic')
+
+# Per phase: times measured, min, total and max microseconds
+counts = [0] * len(NAMES)
+mins = [0] * len(NAMES)
+totals = [0] * len(NAMES)
+maxs = [0] * len(NAMES)
+
+
+def start():
+    """
+    Start measuring a phase. Give the result to stop()
+    """
+    return time.ticks_us()
+
+
+def stop(phase, started):
+    """
+    End the measure of a phase started with start(). Returns the microseconds
+    """
+    us = time.ticks_diff(time.ticks_us(), started)
+    if not counts[phase] or us < mins[phase]:
+        mins[phase] = us
+    if us > maxs[phase]:
+        maxs[phase] = us
+    totals[phase] += us
+    counts[phase] += 1
+    return us
+
+
+def reset():
+    """
+    Forget all the measures
+    """
+    for phase in range(len(NAMES)):
+        counts[phase] = 0
+        mins[phase] = 0
+        totals[phase] = 0
+        maxs[phase] = 0
+
+
+def ms(us):
+    """
+    Microseconds as short text in milliseconds
+    """
+    if us >= 10000:
+        return str(us // 1000)
+    return '{:.2g}'.format(us / 1000)
+
+
+def digest():
+    """
+    Text with the phases measured as name:count:min/avg/max in milliseconds,
+    like 'wifi:1:512/512/512 display:3:9.1/14/21'. Empty if there are none
+    """
+    parts = []
+    for phase, name in enumerate(NAMES):
+        count = counts[phase]
+        if count:
+            parts.append('{}:{}:{}/{}/{}'.format(
+                name, count, ms(mins[phase]), ms(totals[phase] // count), ms(maxs[phase])))
+    return ' '.join(parts)
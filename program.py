@@ -0,0 +1,620 @@
+# Estenopeica-control
+# The program after the fast path of wake.py: the display, the WiFi, mqtt,
+# the sensor and the pictures, run as asyncio tasks until it goes back to
+# deep sleep.
+
+import time
+import sys
+import machine
+import rtcstate
+import timekeeping
+from config import *
+# What the fast path left: the state and how the program woke up
+from wake import (boot_started, state, resuming, recovering, wdt, due_openings,
+                  deep_sleep)
+import os
+import network
+from machine import I2C
+from machine import Pin
+import ssd1306
+from umqtt.simple import MQTTClient
+import telemetry
+import wificonn
+import phases
+import memstats
+import flashlog
+import cameras
+import humidity
+import ephemeris
+import uasyncio as asyncio
+
+# ---
+## Setup the display
+# Reset the pins, Not sure
+rst = Pin(16, Pin.OUT)
+rst.value(1)
+
+# Setup Pin for oled
+scl = Pin(15, Pin.OUT, Pin.PULL_UP)
+sda = Pin(4, Pin.OUT, Pin.PULL_UP)
+i2c = I2C(scl=scl, sda=sda, freq=450000)
+oled = ssd1306.SSD1306_I2C(128, 64, i2c, addr=0x3c)
+# Lines of the screen composed by write_screen() now in the display
+last_screen = None
+# Lines for the display task, and the event that wakes it up
+screen = None
+screen_changed = asyncio.Event()
+
+# ---
+
+def write_screen(lines):
+    """
+    Write a full screen in the oled display, one text per line.
+    All the lines are drawn first and sent to the display once.
+    If the screen is the same that is already shown, nothing is sent.
+    """
+    global last_screen
+    lines = tuple(lines)
+    if lines == last_screen:
+        return
+    started = phases.start()
+    oled.fill(0)
+    for line, text in enumerate(lines):
+        # Separation from left side, 5 pixels, and 10 pixels per line
+        oled.text(text, 5, line * 10)
+    oled.show()
+    phases.stop(phases.DISPLAY, started)
+    last_screen = lines
+
+def set_screen(lines):
+    """
+    Ask the display task to show these lines. Does not touch the display
+    """
+    global screen
+    screen = lines
+    screen_changed.set()
+
+def start_wifi():
+    """
+    Start connecting to the wifi and return, it goes on in the background
+    until setup_wifi()
+    """
+    # turn off the WiFi Access Point, just in case
+    ap_if = network.WLAN(network.AP_IF)
+    ap_if.active(False)
+    wificonn.begin()
+
+def setup_wifi(max_attempts=None):
+    """
+    Setup the wifi. See wificonn.py for how it connects.
+    Returns True if connected
+    """
+    write_screen(['Setting up wifi'])
+
+    # connect the device to the WiFi network
+    wlan = wificonn.connect(max_attempts)
+
+    if wlan is None:
+        print('Could not connect to the WiFi network.')
+        write_screen(['Setting up wifi', 'Could not connect', 'to Wifi'])
+        return False
+
+    write_screen(['Setting up wifi', 'Connected in', '{} ms'.format(wificonn.connect_time())])
+    return True
+
+
+def setup_network():
+    """
+    Wait for the wifi, get the time from NTP if the RTC could be wrong by
+    now, and connect to mqtt
+    """
+    started = phases.start()
+    setup_wifi(WIFI_ATTEMPTS if resuming or recovering else None)
+    phases.stop(phases.WIFI, started)
+    pause()
+
+    # Get the correct time and date from the Internet, only if the RTC could be
+    # wrong by now. See timekeeping.py
+    if timekeeping.need_sync(state):
+        write_screen(['Setting the time', 'from NTP'])
+        started = phases.start()
+        while not timekeeping.sync(state) and not resuming and not recovering:
+            # At the first boot there is no time at all, keep trying
+            write_screen(['Setting the time', 'from NTP', 'No answer, retry'])
+            time.sleep(10)
+            wdt.feed()
+        phases.stop(phases.NTP, started)
+
+    started = phases.start()
+    mqtt_connect()
+    phases.stop(phases.MQTT, started)
+    # How long the WiFi took to connect
+    telem.add(FEED_WIFI, wificonn.connect_time())
+    network_ready.set()
+
+def setup_mqtt():
+    """
+    Setup mqtt
+    """
+    write_screen(['Setting mqtt'])
+    # Create a random MQTT clientID
+    random_num = int.from_bytes(os.urandom(3), 'little')
+    mqtt_client_id = bytes('client_'+str(random_num), 'utf-8')
+
+    # Read credentials from file
+    cred_f = open('adafruit-credentials.txt')
+    credentials = cred_f.readline().strip()
+
+    # connect to Adafruit IO MQTT broker using unsecure TCP (port 1883)
+    # To use a secure connection (encrypted) with TLS:
+    #   set MQTTClient initializer parameter to "ssl=True"
+    #   Caveat: a secure connection uses about 9k bytes of the heap
+    #         (about 1/4 of the micropython heap on the ESP8266 platform)
+    ADAFRUIT_IO_KEY = credentials.encode()
+
+    client = MQTTClient(client_id=mqtt_client_id,
+                        server=ADAFRUIT_IO_URL,
+                        user=ADAFRUIT_USERNAME,
+                        password=ADAFRUIT_IO_KEY,
+                        keepalive=MQTT_KEEPALIVE,
+                        ssl=False)
+    return client
+
+def mqtt_connect():
+    """
+    Connect to the mqtt broker. If it can not, the program keeps going and
+    the telemetry stays in the buffer until the next try
+    """
+    global mqtt_connected
+    try:
+        client.connect()
+        mqtt_connected = True
+    except Exception as e:
+        mqtt_connected = False
+        set_screen(['Cant connect', 'to mqtt'])
+        print('could not connect to MQTT server {}{}'.format(type(e).__name__, e))
+    return mqtt_connected
+
+def flush_telemetry():
+    """
+    Send the buffered telemetry, connecting to the broker if needed.
+    The times of the phases since the last flush and the state of the
+    memory go with it
+    """
+    global mqtt_connected
+    digest = phases.digest()
+    if digest:
+        telem.add(FEED_DIAG, digest)
+        phases.reset()
+    probe = DEBUG or time.time() >= state.get('mem_probe', 0)
+    if probe:
+        state['mem_probe'] = time.time() + MEM_PROBE_PERIOD
+    telem.add(FEED_DIAG_MEM, memstats.digest(probe))
+    if not mqtt_connected and not mqtt_connect():
+        return False
+    started = phases.start()
+    if not telem.flush(client):
+        mqtt_connected = False
+    phases.stop(phases.PUBLISH, started)
+    return mqtt_connected
+
+def keep_time():
+    """
+    Correct the RTC with its drift, and sync it with NTP if it could be
+    wrong by now. Without deep sleep there are no more wake ups to do it.
+    NTP only with the broker connected, so not every time in an outage
+    """
+    timekeeping.correct(state)
+    if mqtt_connected and timekeeping.need_sync(state):
+        started = phases.start()
+        timekeeping.sync(state)
+        phases.stop(phases.NTP, started)
+
+def setup_humidity_sensor():
+    """
+    Setup humidity sensor
+    """
+    write_screen(['Setting up', 'humidity sensor'])
+    # Pin for Analog value read of the humid sensor
+    # Pin 33 in the heltec is the input
+    return humidity.Sensor(33, HUM_SAMPLES, HUM_TRIM, HUM_EMA_SHIFT)
+
+def setup_cameras():
+    """
+    Setup the cameras. After a deep sleep or a reset they were left closed
+    and unpowered, so they are not moved. Otherwise they are closed, one
+    servo at a time
+    """
+    if resuming or recovering:
+        return [cameras.Camera(config, config['closed']) for config in CAMERAS]
+    write_screen(['Setting up', 'Servos'])
+    # Where they are is not known, so they go straight to closed
+    cams = [cameras.Camera(config) for config in CAMERAS]
+    for camera in cams:
+        cameras.move(camera, camera.closed)
+    cameras.wait()
+    write_screen(['Closing', 'Pinholes', 'Closed'])
+    return cams
+
+def open_shutters(due, actual_time_seconds, shutters):
+    """
+    Open the pinholes of the cameras of due, a list of (camera index,
+    opening), and add their shutter records to shutters. It does not wait.
+    Each one is open the seconds of exposure_time(), less what it was
+    already open if a reset cut the exposure
+    """
+    # Seconds they were already open, if a reset cut the exposures
+    topup = state.pop('topup', [])
+    added = []
+    for index, opening in due:
+        exposed = 0
+        for camera, cut, seconds in topup:
+            if camera == index and cut == opening:
+                exposed = seconds
+        added.append([index, opening, actual_time_seconds - exposed, exposure_time(cams[index], opening)])
+    shutters.extend(added)
+    # Kept in RTC memory while open, so after a reset they are closed and
+    # the exposures are not taken twice. See recover_shutters()
+    state['shutter'] = shutters
+    rtcstate.save(state)
+
+    ## Open them. The servos move one after the other, each timer starts
+    ## when its servo starts to move
+    for index, opening, opened, open_time in added:
+        cameras.expose(cams[index], open_time - (actual_time_seconds - opened), shutter_closed.set)
+        ## Publish
+        telem.add(cams[index].feed, 1)
+    set_screen(['Opening'] + [cams[index].name for index, _ in due] + ['Open'])
+
+async def wake_at(seconds):
+    """
+    Wake take_pics() at a time (local seconds) even if no pinhole closed
+    """
+    await asyncio.sleep(seconds - (time.time() + UTC_OFFSET))
+    shutter_closed.set()
+
+async def take_pics(due, actual_time_seconds):
+    """
+    Open the pinholes of the cameras of due, a list of (camera index,
+    opening), and wait until they are all closed. The other cameras whose
+    opening comes while they are open are opened too, on time.
+    Each pinhole is closed by a hardware timer, so the display, the
+    telemetry and the other tasks do not change the exposure.
+    Returns (camera index, opening, when it was told to open, time it was
+    open in ms, resumed) of each one. The time open is from the start of the
+    opening move to the start of the closing one, both moves take the same
+    time.
+    """
+    shutters = []
+    # When each camera was told to open
+    started = {}
+    for index, _ in due:
+        started[index] = actual_time_seconds
+    open_shutters(due, actual_time_seconds, shutters)
+
+    # Wait for the timers to close them, and the servos to be still
+    while cameras.exposing or cameras.moving is not None:
+        now = time.time() + UTC_OFFSET
+        # The next opening of the cameras that did not open yet
+        due, opening_seconds = due_openings(state, now, started)
+        if due:
+            for index, _ in due:
+                started[index] = now
+            open_shutters(due, now, shutters)
+            continue
+        waker = asyncio.create_task(wake_at(opening_seconds)) if opening_seconds is not None else None
+        await shutter_closed.wait()
+        if waker:
+            waker.cancel()
+    set_screen(['Closing', 'Pinholes', 'Closed'])
+    exposures = []
+    for index, opening, opened, open_time in shutters:
+        camera = cams[index]
+        exposure = camera.exposure() + (started[index] - opened) * 1000
+        ## Publish
+        telem.add(camera.feed, 0)
+        telem.add(camera.exposure_feed, exposure)
+        exposures.append((index, opening, started[index], exposure, 1 if opened != started[index] else 0))
+    return exposures
+
+
+def exposure_time(camera, opening_seconds):
+    """
+    Seconds to open a camera for an opening, from the altitude of the sun
+    in the table of ephemeris.py. The open time of the camera if there is
+    no table
+    """
+    sun = ephemeris.lookup(opening_seconds)
+    if sun is None:
+        return camera.open_time
+    altitude, factor = sun
+    telem.add(FEED_SUN, (altitude + 50) // 100)
+    # The open time of the camera is for the sun at REFERENCE_ALTITUDE
+    seconds = (camera.open_time * factor + ephemeris.FACTOR_SCALE // 2) // ephemeris.FACTOR_SCALE
+    return min(max(seconds, EXPOSURE_MIN), EXPOSURE_MAX)
+
+
+def pause():
+    """
+    Give time to read the display, only in DEBUG
+    """
+    if DEBUG:
+        time.sleep(1)
+
+
+# Main code before the loop
+# Only in DEBUG there is a splash and pauses. When resuming from deep sleep
+# the RTC still has the time from NTP, corrected for its drift.
+# The oled first
+if DEBUG and not resuming:
+    write_screen(['Estenopeica', 'Abuelo 2.6', 'Open day:' + str(day_of_opening)])
+    pause()
+
+# The wifi connects in the background while the hardware is set up, the
+# steps that need the network come after
+wificonn.feed = wdt.feed
+start_wifi()
+
+# Setup the cameras. The pinholes are closed before anything else
+cams = setup_cameras()
+# Raised when a pinhole was closed at the end of an exposure
+shutter_closed = asyncio.ThreadSafeFlag()
+pause()
+
+# Setup humidity sensor, with the first reading
+hum = setup_humidity_sensor()
+started = phases.start()
+hum.read()
+phases.stop(phases.SENSOR, started)
+pause()
+
+# Telemetry waiting to be sent, with what was not sent before sleeping
+telem = telemetry.Telemetry(ADAFRUIT_USERNAME, ADAFRUIT_IO_GROUP, latest=FEEDS_LATEST)
+telem.load()
+client = setup_mqtt()
+mqtt_connected = False
+# Set when the wifi, NTP and mqtt are done, see setup_network()
+network_ready = asyncio.Event()
+# At the first boot there is no time at all, nothing can be decided without
+# NTP. Otherwise the RTC has the time and the network joins in a task, so a
+# picture due now is not late by the WiFi
+if not resuming and not recovering:
+    setup_network()
+if 'quick_wake_ms' in state:
+    telem.add(FEED_QUICK_WAKE, state.pop('quick_wake_ms'))
+if not resuming and not recovering:
+    # The servos were closed
+    for camera in cams:
+        telem.add(camera.feed, 0)
+# Log in the flash, with the records kept in the RTC memory while sleeping
+log = flashlog.Log(state)
+if not resuming:
+    log.add(flashlog.BOOT, time.time(), extra=machine.reset_cause())
+if recovering:
+    telem.add(FEED_RESET, machine.reset_cause())
+if 'recovered' in state:
+    for camera, opening, exposed, counted in state.pop('recovered'):
+        if counted:
+            # The extra tells the camera, and that it was cut by a reset
+            log.add(flashlog.EXPOSURE, opening - UTC_OFFSET, exposure=exposed * 1000, extra=camera << 1 | 1)
+    log.flush()
+if DEBUG:
+    write_screen(['Going to loop'])
+    pause()
+
+
+async def sensor_task():
+    """
+    Read the humidity every SENSOR_PERIOD for the moving average, and report
+    it to the log and the telemetry every REPORT_PERIOD, when next_report is
+    due. The first reading was taken in the boot
+    """
+    global boot_ms
+    while True:
+        hum_value = hum.smooth(state)
+        set_screen(['Reading Humidity', 'Hum ' + str(hum_value)])
+        actual_time_seconds = time.time() + UTC_OFFSET
+        if actual_time_seconds >= state['next_report']:
+            # The boot time goes with the report of the wake up, if it has one
+            log.add(flashlog.REPORT, time.time(), hum_value, hum.spread, latency=boot_ms)
+            telem.add(FEED_HUM, hum_value)
+            telem.add(FEED_HUM_SPREAD, hum.spread)
+            state['reports'] += 1
+            # Keep the reports on the hour, unless some were skipped
+            state['next_report'] += REPORT_PERIOD
+            if state['next_report'] <= actual_time_seconds:
+                state['next_report'] = actual_time_seconds + REPORT_PERIOD
+        boot_ms = 0
+        # Do not read a whole SENSOR_PERIOD past the report
+        await asyncio.sleep(max(min(SENSOR_PERIOD, state['next_report'] - actual_time_seconds), 1))
+        started = phases.start()
+        hum.read()
+        phases.stop(phases.SENSOR, started)
+
+async def mqtt_task():
+    """
+    Send the buffered telemetry every TELEMETRY_PERIOD if not using deep
+    sleep, and keep the mqtt connection alive. Without deep sleep it also
+    keeps the time of the RTC right
+    """
+    global mqtt_connected
+    await network_ready.wait()
+    last_flush = time.ticks_ms()
+    last_sent = time.ticks_ms()
+    while True:
+        if not DEEP_SLEEP and time.ticks_diff(time.ticks_ms(), last_flush) >= TELEMETRY_PERIOD * 1000:
+            keep_time()
+            flush_telemetry()
+            last_flush = time.ticks_ms()
+            last_sent = last_flush
+        elif time.ticks_diff(time.ticks_ms(), last_sent) >= MQTT_KEEPALIVE * 500:
+            # Without a connection there is nothing to ping, but the clock
+            # is restarted anyway so the wait below does not drop to zero
+            if mqtt_connected:
+                try:
+                    client.ping()
+                except OSError:
+                    mqtt_connected = False
+            last_sent = time.ticks_ms()
+        # Sleep until the next flush or ping is due
+        wait = MQTT_KEEPALIVE * 500 - time.ticks_diff(time.ticks_ms(), last_sent)
+        if not DEEP_SLEEP:
+            wait = min(wait, TELEMETRY_PERIOD * 1000 - time.ticks_diff(time.ticks_ms(), last_flush))
+        await asyncio.sleep(max(wait, 0) / 1000)
+
+async def display_task():
+    """
+    Show the last screen asked with set_screen()
+    """
+    while True:
+        await screen_changed.wait()
+        screen_changed.clear()
+        write_screen(screen)
+
+def pictures_busy():
+    """
+    Check if a pinhole is open or moving, or an opening comes before the
+    network could join
+    """
+    if cameras.exposing or cameras.moving is not None:
+        return True
+    actual_time_seconds = time.time() + UTC_OFFSET
+    due, opening_seconds = due_openings(state, actual_time_seconds)
+    return bool(due) or opening_seconds < actual_time_seconds + JOIN_TIME
+
+async def network_task():
+    """
+    Join the network after waking up with the time in the RTC. It blocks the
+    other tasks while it connects, so it waits until the pictures are done
+    """
+    while pictures_busy():
+        await asyncio.sleep(1)
+    setup_network()
+
+async def exposure_task():
+    """
+    Decide when to take the pictures and take them
+    """
+    while True:
+        # Get current time
+        actual_time_seconds = time.time() + UTC_OFFSET
+        # Get when it is going to be the next picture time of each camera,
+        # and the ones that are due
+        started = phases.start()
+        due, opening_seconds = due_openings(state, actual_time_seconds)
+        phases.stop(phases.SCHEDULE, started)
+
+        #
+        # Decide if to take photos or not!
+        #
+        if due:
+            # Open the holes and Take photos
+            set_screen(['Take Photo!'])
+            started = phases.start()
+            exposures = await take_pics(due, actual_time_seconds)
+            phases.stop(phases.PIC, started)
+            jitter = 0
+            for index, opening, opened, exposure, resumed in exposures:
+                # Written right away, the exposures are the important records.
+                # The extra tells the camera, and if a reset cut it
+                log.add(flashlog.EXPOSURE, opening - UTC_OFFSET, exposure=exposure,
+                        latency=(opened - opening) * 1000, extra=index << 1 | resumed)
+                # Shortest and longest exposures of each camera, to see how much they vary
+                key = str(index)
+                state['exp_min'] = state.get('exp_min', {})
+                state['exp_max'] = state.get('exp_max', {})
+                state['exp_min'][key] = min(state['exp_min'].get(key, exposure), exposure)
+                state['exp_max'][key] = max(state['exp_max'].get(key, exposure), exposure)
+                jitter = max(jitter, state['exp_max'][key] - state['exp_min'][key])
+                state['last_pic'][index] = opening
+                state['pics'] += 1
+            log.flush()
+            telem.add(FEED_JITTER, jitter)
+            del state['shutter']
+            rtcstate.save(state)
+            continue
+
+        if not network_ready.is_set():
+            # Nothing to open now, but the reports and the telemetry need the
+            # network before sleeping. It may wait for the next opening
+            await asyncio.sleep(min(opening_seconds - actual_time_seconds, 1))
+            continue
+
+        # Wait until the picture time, but check at least every REPORT_PERIOD
+        waiting_time = min(opening_seconds - actual_time_seconds, REPORT_PERIOD)
+        # positions: (year, month, mday, hour, minute, second, weekday, yearday)
+        picture_time = time.localtime(opening_seconds)
+        msg1 = 'Next check:'
+        msg2 = '{:.3}hs'.format(waiting_time / 3600)
+        set_screen(['Next open time', str(picture_time), msg1, msg2])
+        telem.add(FEED_WAITING, waiting_time)
+
+        if DEEP_SLEEP:
+            # Wake up exactly for the next report or opening. Does not return.
+            flush_telemetry()
+            telem.save()
+            log.save()
+            write_screen(screen)
+            if mqtt_connected:
+                client.disconnect()
+            deep_sleep(state)
+        await asyncio.sleep(waiting_time)
+
+async def watchdog_task():
+    """
+    Feed the watchdog while the loop runs
+    """
+    while True:
+        wdt.feed()
+        await asyncio.sleep_ms(WDT_TIMEOUT // 4)
+
+def restart(e):
+    """
+    Something failed. Keep the telemetry, the log and the state, and reset.
+    The state in RTC memory tells what was going on
+    """
+    print('Error, restarting. {}: {}'.format(type(e).__name__, e))
+    try:
+        telem.save()
+        log.save()
+        rtcstate.save(state)
+    finally:
+        machine.reset()
+
+def task_failed(loop, context):
+    """
+    An error in a task. Without this the task ends and the rest goes on
+    """
+    restart(context['exception'])
+
+async def main():
+    """
+    Run all the tasks. The exposure task is the only one that ends, if the
+    esp32 goes to deep sleep
+    """
+    asyncio.get_event_loop().set_exception_handler(task_failed)
+    asyncio.create_task(watchdog_task())
+    asyncio.create_task(sensor_task())
+    asyncio.create_task(mqtt_task())
+    asyncio.create_task(display_task())
+    # Let the tasks do their first round, so there is a report before
+    # going to sleep
+    await asyncio.sleep(0)
+    if not network_ready.is_set():
+        asyncio.create_task(network_task())
+    await exposure_task()
+
+# Main loop
+boot_ms = time.ticks_diff(time.ticks_ms(), boot_started)
+telem.add(FEED_BOOT, boot_ms)
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    print('Ctrl-C pressed...exiting')
+    telem.save()
+    log.flush()
+    if mqtt_connected:
+        client.disconnect()
+    sys.exit()
+except Exception as e:
+    restart(e)
@@ -0,0 +1,30 @@
+# Estenopeica-control
+# Small state of the program kept in the RTC memory of the esp32.
+# The RTC memory survives deep sleep (not a power cut), so the program can
+# remember what it was doing after waking up, without touching the flash.
+#
+# The state is a dict saved as json. Keep it small, the esp32 only has
+# 2048 bytes of RTC memory for the user.
+
+import json
+import machine
+
+
+def load():
+    """
+    Load the state saved in RTC memory. Empty if there is none or it is broken
+    """
+    data = machine.RTC().memory()
+    if not data:
+        return {}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {}
+
+
+def save(state):
+    """
+    Save the state in RTC memory
+    """
+    machine.RTC().memory(json.dumps(state))
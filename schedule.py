@@ -0,0 +1,77 @@
+# Estenopeica-control
+# Calculation of the opening times of the pinhole.
+#
+# All the functions are pure: no display, no sleeps, no clock reading. Times
+# are seconds since the epoch, already in local time (with the UTC offset
+# added), like the times used in program.py.
+#
+# A schedule is a dict with:
+#   'times': tuple of (hour, minute, second) of the openings in a day
+#   'weekdays': tuple of days of the week, 0 monday ... 6 sunday.
+#               None for every day. Optional
+#   'every': open only every this many days. Optional, default 1
+#   'start': a day (in seconds) that is an opening day when 'every' is
+#            more than 1. Optional, default the epoch
+# Example, sundays and wednesdays at 12:00 and 12:30:
+#   {'weekdays': (6, 2), 'times': ((12, 0, 0), (12, 30, 0))}
+
+import time
+
+DAY = 86400
+# Day of the week of the epoch. It is not the same in MicroPython and in Python
+EPOCH_WEEKDAY = time.gmtime(0)[6]
+
+
+def is_opening_day(schedule, day):
+    """
+    Check if the day number (days since the epoch) is an opening day
+    """
+    weekdays = schedule.get('weekdays')
+    if weekdays is not None and (day + EPOCH_WEEKDAY) % 7 not in weekdays:
+        return False
+    every = schedule.get('every', 1)
+    return every == 1 or (day - schedule.get('start', 0) // DAY) % every == 0
+
+
+def next_opening_of(schedule, now):
+    """
+    Get the time in seconds of the first opening of one schedule at or after now
+    """
+    day = now // DAY
+    second_of_day = now - day * DAY
+    seconds = sorted(h * 3600 + m * 60 + s for h, m, s in schedule['times'])
+    # Within 7 times 'every' days all the combinations of weekday and
+    # period were seen, so if there is an opening it is before that
+    for offset in range(7 * schedule.get('every', 1) + 1):
+        if not is_opening_day(schedule, day + offset):
+            continue
+        for second in seconds:
+            if offset or second >= second_of_day:
+                return (day + offset) * DAY + second
+    raise ValueError('schedule without openings')
+
+
+def next_opening(now, schedules):
+    """
+    Get the time in seconds of the first opening of any schedule at or after now
+    """
+    return min(next_opening_of(schedule, now) for schedule in schedules)
+
+
+def seconds_to_next(now, schedules):
+    """
+    Get the seconds to wait from now until the next opening. 0 if it is now
+    """
+    return next_opening(now, schedules) - now
+
+
+def next_openings(now, schedules, count):
+    """
+    Get the times in seconds of the next count openings at or after now
+    """
+    openings = []
+    for _ in range(count):
+        now = next_opening(now, schedules)
+        openings.append(now)
+        now += 1
+    return openings
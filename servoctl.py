@@ -0,0 +1,111 @@
+# Estenopeica-control
+# Smooth servo moves that leave the servo unpowered when it is still.
+#
+# A move ramps the pulse of the PWM (with duty_ns) from where the servo is to
+# the target: it speeds up with a constant acceleration, goes at most at a
+# maximum speed and slows down the same way to stop at the target, so the
+# door of the camera does not slam and shake it. The steps are done by a
+# hardware timer, once per period of the PWM, so the program keeps running
+# while the servo moves.
+# After the target, the PWM keeps driving it during the settle time, and then
+# it is turned off: the servo does not draw current nor buzz while still.
+# It is attached again only for the next move.
+#
+# Usage:
+#   door = servoctl.Servo(17, closed=684000)
+#   door.move(1114000)
+#   door.wait()
+
+import time
+from machine import Pin
+from machine import PWM
+from machine import Timer
+
+# Frequency of the PWM of the servos
+FREQ = 50
+# Time between the steps of a move (ms). One period of the PWM
+STEP_MS = 1000 // FREQ
+# Change of the speed (ns of pulse per step, per step) and maximum speed
+# (ns of pulse per step). With these a move of the door takes about half a second
+ACCELERATION = 4000
+MAX_SPEED = 40000
+# Time (ms) to keep driving the servo after the target, until it is still
+SETTLE_MS = 300
+
+
+class Servo:
+    def __init__(self, pin, position=None, timer=1, acceleration=ACCELERATION,
+                 max_speed=MAX_SPEED, settle_ms=SETTLE_MS):
+        self.pin = Pin(pin)
+        # Pulse (ns) where the servo is. None if not known, then the first
+        # move goes straight to the target
+        self.position = position
+        self.timer = Timer(timer)
+        self.acceleration = acceleration
+        self.max_speed = max_speed
+        self.settle_steps = settle_ms // STEP_MS
+        self.pwm = None
+        self.target = position
+        self.speed = 0
+        self.settle = 0
+        self.moving = False
+        self.done = None
+
+    def move(self, target, done=None):
+        """
+        Start moving to the target pulse (ns). It does not wait, done() is
+        called when the servo is still and unpowered
+        """
+        self.target = target
+        self.done = done
+        self.speed = 0
+        self.settle = self.settle_steps
+        if self.position is None:
+            self.position = target
+        if self.pwm is None:
+            self.pwm = PWM(self.pin, freq=FREQ, duty_ns=self.position)
+        else:
+            self.pwm.duty_ns(self.position)
+        self.moving = True
+        self.timer.init(mode=Timer.PERIODIC, period=STEP_MS, callback=self.step)
+
+    def step(self, timer):
+        """
+        One step of the move, called by the timer
+        """
+        left = self.target - self.position
+        if left:
+            distance = abs(left)
+            # Slow down if stopping from this speed takes the distance left
+            if self.speed * self.speed > 2 * self.acceleration * distance:
+                self.speed = max(self.speed - self.acceleration, self.acceleration)
+            else:
+                self.speed = min(self.speed + self.acceleration, self.max_speed)
+            step = min(self.speed, distance)
+            self.position += step if left > 0 else -step
+            self.pwm.duty_ns(self.position)
+        elif self.settle:
+            self.settle -= 1
+        else:
+            self.stop()
+
+    def stop(self):
+        """
+        Stop the move where it is and turn off the PWM
+        """
+        self.timer.deinit()
+        if self.pwm is not None:
+            self.pwm.deinit()
+            self.pwm = None
+        self.moving = False
+        done = self.done
+        self.done = None
+        if done:
+            done()
+
+    def wait(self):
+        """
+        Wait until the servo is still and unpowered
+        """
+        while self.moving:
+            time.sleep_ms(STEP_MS)
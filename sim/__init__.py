@@ -0,0 +1,58 @@
+# Host side stand-ins for the MicroPython modules used by the estenopeica
+# programs, so the real code can run and be measured on a normal computer.
+# See harness.py to run main.py in a simulated world with a virtual clock.
+#
+# Usage:
+#   import sim
+#   sim.install()
+#   import ssd1306
+
+import builtins
+import gc
+import os
+import sys
+import time
+
+# Root of the repository, where the programs copied to the esp32 live
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def install():
+    """
+    Make the stand-in modules importable with the MicroPython names
+    """
+    from sim import framebuf
+    from sim import machine
+    from sim import network
+    from sim import ntptime
+    from sim import ubinascii
+    from sim import uasyncio
+    from sim import umqtt
+    from sim.umqtt import simple
+    from sim.umqtt import robust
+    # MicroPython has const() as a builtin
+    builtins.const = lambda value: value
+    # Nor the MicroPython extensions of the time module
+    if not hasattr(time, 'sleep_ms'):
+        time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+        time.sleep_us = lambda us: time.sleep(us / 1000000)
+        time.ticks_ms = lambda: time.monotonic_ns() // 1000000
+        time.ticks_us = lambda: time.monotonic_ns() // 1000
+        time.ticks_diff = lambda new, old: new - old
+        time.ticks_add = lambda ticks, delta: ticks + delta
+    # Nor the heap information of the gc module. A heap like the one of the
+    # esp32, that is never full nor fragmented
+    if not hasattr(gc, 'mem_free'):
+        gc.mem_free = lambda: 100000
+        gc.mem_alloc = lambda: 10000
+    sys.modules['framebuf'] = framebuf
+    sys.modules['machine'] = machine
+    sys.modules['network'] = network
+    sys.modules['ntptime'] = ntptime
+    sys.modules['ubinascii'] = ubinascii
+    sys.modules['uasyncio'] = uasyncio
+    sys.modules['umqtt'] = umqtt
+    sys.modules['umqtt.simple'] = simple
+    sys.modules['umqtt.robust'] = robust
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
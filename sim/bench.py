@@ -0,0 +1,283 @@
+# Performance and energy benchmarks of the estenopeica programs over
+# simulated deployments, so the cost of a wake up can be compared between
+# commits.
+#
+# Two kinds of measures:
+#   - scenarios: main.py runs in the simulated world (see harness.py) for
+#     some days, and what it did is counted: wakes, time awake and with the
+#     radio on, bus bytes, publishes and the estimated battery use in mAh.
+#   - paths: the pieces that run at every wake up (the opening calculation,
+#     composing and showing a screen, publishing the telemetry) are called
+#     many times to measure their time and heap allocations on the host.
+#
+# The results are printed as JSON. Save them with --save and check a later
+# commit against them with --compare, which lists what got worse and exits
+# with 1 if any deterministic measure regressed more than --tolerance.
+#
+# Usage:
+#   python -m sim.bench [--scenario NAME ...] [--save FILE] [--compare FILE]
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import sim
+from sim import harness
+
+# Current (mA) drawn in each state by a Heltec WiFi Kit 32 with the display
+# on. Rough figures, change them with the ones measured on the board.
+CURRENT_SLEEP = 0.8
+CURRENT_AWAKE = 45
+CURRENT_RADIO = 125
+# Added by the servo while it is driven, holding the door
+CURRENT_SERVO = 10
+
+# (name, days, settings of config.py, outages as (day, hours)). The simulation
+# starts on a wednesday at 00:00 UTC, 21:00 of tuesday in UTC_OFFSET.
+SCENARIOS = (
+    # No opening, only the hourly reports
+    ('hourly report', 1, {'day_of_opening': '6'}, ()),
+    # One opening at noon
+    ('opening day', 1, {'day_of_opening': '2'}, ()),
+    # A day without WiFi in a week of daily openings
+    ('wifi outage', 7, {}, ((2, 24),)),
+    # One picture a week for a year
+    ('analemma year', 365, {'day_of_opening': '6'}, ()),
+    # Awake for weeks, the RTC is kept right while it runs
+    ('awake weeks', 20, {'DEEP_SLEEP': 'False'}, ()),
+)
+
+# Measures of the scenarios that do not depend on the host, and are worse
+# when they grow. They are the ones checked by --compare
+DETERMINISTIC = ('wakes', 'awake_seconds', 'radio_seconds', 'servo_seconds', 'awake_per_wake', 'mah', 'mah_per_day',
+                 'i2c_bytes', 'i2c_transactions', 'publishes', 'missed_openings',
+                 'timing_error_max', 'bytes', 'transactions', 'retained_bytes', 'retained_blocks',
+                 'heap_peak')
+
+
+def energy(report):
+    """
+    Estimated battery use (mAh) of a simulation report
+    """
+    radio = report['radio_seconds']
+    awake = report['awake_seconds'] - radio
+    sleep = report['sleep_seconds']
+    servo = report.get('servo_seconds', 0)
+    return (sleep * CURRENT_SLEEP + awake * CURRENT_AWAKE + radio * CURRENT_RADIO
+            + servo * CURRENT_SERVO) / 3600
+
+
+def run_scenario(days, overrides, outages):
+    """
+    Run main.py in the simulated world and return its measures
+    """
+    report = harness.Simulation(days, overrides=dict(overrides), outages=outages).run()
+    mah = energy(report)
+    return {
+        'days': days,
+        'wall_seconds': report['wall_seconds'],
+        'wakes': report['wakes'],
+        'awake_seconds': report['awake_seconds'],
+        'radio_seconds': report['radio_seconds'],
+        'servo_seconds': report['servo_seconds'],
+        'awake_per_wake': round(report['awake_seconds'] / max(report['wakes'], 1), 3),
+        'mah': round(mah, 3),
+        'mah_per_day': round(mah / days, 3),
+        'i2c_transactions': report['i2c_transactions'],
+        'i2c_bytes': report['i2c_bytes'],
+        'publishes': report['publishes'],
+        'exposures': report['exposures'],
+        'missed_openings': report['missed_openings'],
+        'timing_error_max': report['timing_error_max'],
+    }
+
+
+def measure(function, calls):
+    """
+    Call function many times and return the time per call, the largest heap
+    in use during a single call above what there was before it (heap_peak),
+    and the bytes and blocks per call still alive after all the calls
+    (retained_*). CPython frees most temporaries at once by reference
+    counting, so these are a lower bound of what MicroPython allocates,
+    where the garbage stays until a collection
+    """
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    wall = time.perf_counter() - started
+    heap_peak = 0
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(calls):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        heap_peak = max(heap_peak, peak - base)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    return {
+        'us_per_call': round(wall / calls * 1000000, 2),
+        'retained_bytes': round(sum(max(stat.size_diff, 0) for stat in stats) / calls),
+        'retained_blocks': round(sum(max(stat.count_diff, 0) for stat in stats) / calls),
+        'heap_peak': heap_peak,
+    }
+
+
+class RecordingClient:
+    """
+    A mqtt client that only counts what is published
+    """
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self.messages += 1
+        self.bytes += len(topic) + len(msg)
+
+
+def run_paths(calls):
+    """
+    Measure the pieces of a wake up
+    """
+    sim.install()
+    import schedule
+    import ssd1306
+    import telemetry
+    from machine import I2C, Pin
+
+    results = {}
+    schedules = ({'weekdays': (6,), 'times': ((12, 0, 0),)},)
+    now = [19723 * 86400]
+
+    def next_opening():
+        now[0] = schedule.next_opening(now[0], schedules) + 1
+    results['next_opening'] = measure(next_opening, calls)
+
+    i2c = I2C(scl=Pin(15), sda=Pin(4), freq=450000)
+    oled = ssd1306.SSD1306_I2C(128, 64, i2c, addr=0x3c)
+    screens = [('Reading Humidity', 'Hum {}'.format(1800 + i)) for i in range(2)]
+    count = [0]
+
+    def show():
+        # Like write_screen() in program.py, a one line change each time
+        count[0] += 1
+        oled.fill(0)
+        for line, text in enumerate(screens[count[0] % 2]):
+            oled.text(text, 5, line * 10)
+        oled.show()
+    transactions = i2c.transactions
+    sent = i2c.bytes
+    results['show'] = measure(show, calls)
+    results['show']['transactions'] = round((i2c.transactions - transactions) / (2 * calls), 2)
+    results['show']['bytes'] = round((i2c.bytes - sent) / (2 * calls), 2)
+
+    client = RecordingClient()
+    telem = telemetry.Telemetry(b'eldraco', b'default')
+
+    def publish():
+        # The samples of one wake up, sent in one message
+        telem.add('sensor1-hum', 1834, 1735689600)
+        telem.add('waitingtime', 3600, 1735689600)
+        telem.flush(client)
+    results['publish'] = measure(publish, calls)
+    results['publish']['bytes'] = round(client.bytes / (2 * calls), 2)
+    return results
+
+
+def commit():
+    """
+    Short hash of the commit being measured, if this is a git checkout
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=sim.REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=sim.REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out + ('-dirty' if dirty else '')
+
+
+def run(names=None, calls=2000):
+    """
+    Run the scenarios (all if names is None) and the paths. Returns the results
+    """
+    results = {
+        'commit': commit(),
+        'current_ma': {'sleep': CURRENT_SLEEP, 'awake': CURRENT_AWAKE, 'radio': CURRENT_RADIO,
+                       'servo': CURRENT_SERVO},
+        'scenarios': {},
+        'paths': run_paths(calls),
+    }
+    for name, days, overrides, outages in SCENARIOS:
+        if names and name not in names:
+            continue
+        results['scenarios'][name] = run_scenario(days, overrides, outages)
+    return results
+
+
+def compare(old, new, tolerance):
+    """
+    Compare two results. Returns the lines describing the changes and the
+    number of deterministic measures that got worse more than tolerance
+    """
+    lines = []
+    regressions = 0
+    for section in ('scenarios', 'paths'):
+        for name, measures in new[section].items():
+            before = old.get(section, {}).get(name)
+            if before is None:
+                continue
+            for key, value in measures.items():
+                was = before.get(key)
+                if not isinstance(value, (int, float)) or not isinstance(was, (int, float)) or value == was:
+                    continue
+                change = (value - was) / abs(was) if was else float('inf')
+                mark = ''
+                if key in DETERMINISTIC and change > tolerance:
+                    mark = '  REGRESSION'
+                    regressions += 1
+                lines.append('{:14} {:18} {:>12} -> {:>12} {:+8.1%}{}'.format(
+                    name, key, was, value, change, mark))
+    return lines, regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark main.py over simulated deployments')
+    parser.add_argument('--scenario', action='append', metavar='NAME',
+                        choices=[scenario[0] for scenario in SCENARIOS],
+                        help='run only this scenario, can be repeated')
+    parser.add_argument('--calls', type=int, default=2000, help='calls per measured path')
+    parser.add_argument('--save', metavar='FILE', help='write the results to a file')
+    parser.add_argument('--compare', metavar='FILE', help='compare with results saved before')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='fraction a measure may grow before it is a regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args.scenario, args.calls)
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        lines, regressions = compare(old, results, args.tolerance)
+        print('Compared with {}'.format(old.get('commit')), file=sys.stderr)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# Measure what a show() of the SSD1306 driver costs on the bus and on the
+# heap, for the I2C and the SPI interfaces, and how many screens per second
+# the framebuf of sim draws on the host.
+#
+# The heap cost is the number of blocks the driver allocates during show(),
+# counted at every bytecode of ssd1306.py, so the temporary ones freed before
+# show() returns are counted too. CPython boxes the integers above 256 that
+# MicroPython keeps inside the object pointer, so blocks no bigger than an
+# int are left out.
+#
+# Usage:
+#   python -m sim.bench_display
+
+import collections
+import sys
+import time
+import tracemalloc
+
+import sim
+sim.install()
+
+import ssd1306
+from machine import I2C, SPI, Pin
+
+# Screens like the ones program.py shows. The second one changes a single line.
+SCREEN_1 = ('Reading Humidity', 'Hum 1834')
+SCREEN_2 = ('Reading Humidity', 'Hum 1840')
+
+
+def draw(oled, lines):
+    """
+    Draw a screen the same way program.py does
+    """
+    oled.fill(0)
+    for line, text in enumerate(lines):
+        oled.text(text, 5, line * 10)
+
+
+def count_allocations(call):
+    """
+    Call call() and return the number of blocks ssd1306.py allocated in it,
+    freed or not by the time it returns
+    """
+    driver = [tracemalloc.Filter(True, ssd1306.__file__)]
+    boxed_int = sys.getsizeof(1 << 30)
+    seen = collections.Counter()
+    allocated = 0
+
+    def check(count=True):
+        nonlocal seen, allocated
+        now = collections.Counter((trace.traceback, trace.size)
+                                  for trace in tracemalloc.take_snapshot().filter_traces(driver).traces
+                                  if trace.size > boxed_int)
+        if count:
+            allocated += sum((now - seen).values())
+        seen = now
+
+    def trace(frame, event, arg):
+        if frame.f_code.co_filename != ssd1306.__file__:
+            return None
+        frame.f_trace_opcodes = True
+        # At a call, the new block is the frame object the tracing itself
+        # asked for, which MicroPython does not have
+        check(event != 'call')
+        return trace
+
+    tracemalloc.start()
+    sys.settrace(trace)
+    try:
+        call()
+    finally:
+        sys.settrace(None)
+    check()
+    tracemalloc.stop()
+    return allocated
+
+
+def measure(oled, bus, lines):
+    """
+    Draw a screen and show it. Return the bus and heap cost of show()
+    """
+    draw(oled, lines)
+    transactions = bus.transactions
+    sent = bus.bytes
+    allocs = count_allocations(oled.show)
+    return {
+        'transactions': bus.transactions - transactions,
+        'bytes': bus.bytes - sent,
+        'allocs': allocs,
+    }
+
+
+def render_rate(oled, seconds=0.5):
+    """
+    Screens drawn per second in the framebuffer, without show()
+    """
+    frames = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        draw(oled, SCREEN_1 if frames & 1 else SCREEN_2)
+        frames += 1
+    return frames / (time.perf_counter() - started)
+
+
+def run():
+    """
+    Show a full screen, a one line change and an unchanged screen
+    on both interfaces and print the cost of each show()
+    """
+    i2c = I2C(scl=Pin(15), sda=Pin(4), freq=450000)
+    spi = SPI(1)
+    displays = (
+        ('i2c', ssd1306.SSD1306_I2C(128, 64, i2c, addr=0x3c), i2c),
+        ('spi', ssd1306.SSD1306_SPI(128, 64, spi, Pin(2), Pin(16), Pin(5)), spi),
+    )
+    print('{:4} {:10} {:>6} {:>6} {:>6}'.format('bus', 'screen', 'trans', 'bytes', 'allocs'))
+    for name, oled, bus in displays:
+        for label, lines in (('full', SCREEN_1), ('one line', SCREEN_2), ('unchanged', SCREEN_2)):
+            cost = measure(oled, bus, lines)
+            print('{:4} {:10} {:>6} {:>6} {:>6}'.format(
+                name, label, cost['transactions'], cost['bytes'], cost['allocs']))
+    print('spi bus init calls: {}'.format(spi.inits))
+    print('screens drawn per second: {:.0f}'.format(render_rate(displays[0][1])))
+
+
+if __name__ == '__main__':
+    run()
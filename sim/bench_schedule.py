@@ -0,0 +1,84 @@
+# Check and time the opening calculator of schedule.py over a simulated
+# calendar of several years. The openings are checked against a slow
+# calculation done with the datetime module of Python.
+#
+# Usage:
+#   python -m sim.bench_schedule [years]
+
+import datetime
+import random
+import sys
+import time
+
+import sim
+sim.install()
+
+import schedule
+
+# Schedules like the ones of the camera
+SCHEDULES = {
+    'weekly': ({'weekdays': (6,), 'times': ((12, 0, 0),)},),
+    'every day': ({'weekdays': None, 'times': ((12, 0, 0),)},),
+    'several': ({'weekdays': (0, 3), 'times': ((9, 30, 0), (12, 0, 0), (17, 45, 30))},
+                {'weekdays': (5,), 'times': ((7, 0, 0),)}),
+    'every 10 days': ({'every': 10, 'start': 19000 * 86400, 'times': ((12, 0, 0),)},),
+}
+# 2024-01-01 00:00:00
+START = 19723 * 86400
+
+
+def slow_next_opening(now, schedules):
+    """
+    Find the next opening walking the calendar day by day with datetime
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+    today = epoch + datetime.timedelta(days=now // 86400)
+    best = None
+    for sched in schedules:
+        for offset in range(7 * sched.get('every', 1) + 1):
+            day = today + datetime.timedelta(days=offset)
+            if sched.get('weekdays') is not None and day.weekday() not in sched['weekdays']:
+                continue
+            if (day - epoch).days % sched.get('every', 1) != (sched.get('start', 0) // 86400) % sched.get('every', 1):
+                continue
+            for h, m, s in sched['times']:
+                moment = int((day.replace(hour=h, minute=m, second=s) - epoch).total_seconds())
+                if moment >= now and (best is None or moment < best):
+                    best = moment
+    return best
+
+
+def run(years=3):
+    """
+    Check every schedule against the slow calculation and time it
+    """
+    end = START + years * 365 * 86400
+    random.seed(1)
+    samples = [random.randrange(START, end) for _ in range(2000)]
+    for name, schedules in SCHEDULES.items():
+        # Also check right at, and one second after, every opening
+        openings = schedule.next_openings(START, schedules, 200)
+        checks = samples + openings + [t + 1 for t in openings] + [t - 1 for t in openings]
+        for now in checks:
+            expected = slow_next_opening(now, schedules)
+            got = schedule.next_opening(now, schedules)
+            if got != expected:
+                raise AssertionError('{}: next opening after {} is {}, expected {}'.format(name, now, got, expected))
+        # Walk the whole calendar opening by opening, like the camera does
+        started = time.perf_counter()
+        count = 0
+        now = START
+        while now < end:
+            now = schedule.next_opening(now, schedules) + 1
+            count += 1
+        walk = time.perf_counter() - started
+        started = time.perf_counter()
+        for now in samples:
+            schedule.seconds_to_next(now, schedules)
+        per_call = (time.perf_counter() - started) / len(samples)
+        print('{:14} {:6} openings in {} years, {:.1f} ms to walk them, {:.1f} us per call, {} checks ok'.format(
+            name, count, years, walk * 1000, per_call * 1e6, len(checks)))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
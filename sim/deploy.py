@@ -0,0 +1,84 @@
+# Copy the programs to the esp32, with the modules precompiled to MicroPython
+# bytecode (.mpy) by mpy-cross. The esp32 then imports them without parsing
+# and compiling the source at every wake up, and they take less RAM.
+#
+# main.py and boot.py are copied as source, MicroPython only runs them as .py,
+# so main.py only imports the program: the settings (config.py), the fast
+# path of the wake ups (wake.py) and the rest (program.py), all compiled.
+# The table of the sun of ephemeris.py is built with the settings of
+# config.py and copied too.
+# The modules can also be frozen in a custom firmware, with the same list.
+#
+# mpy-cross must match the version of MicroPython of the esp32. It can be
+# installed with `pip install mpy-cross`.
+#
+# Usage:
+#   python -m sim.deploy [--port /dev/cu.usbserial-0001] [--dry-run]
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import sim
+
+# Modules imported by main.py, compiled to .mpy
+MODULES = ('config.py', 'wake.py', 'program.py', 'ssd1306.py', 'rtcstate.py', 'schedule.py',
+           'timekeeping.py', 'telemetry.py', 'wificonn.py', 'phases.py', 'servoctl.py', 'humidity.py',
+           'memstats.py', 'flashlog.py', 'ephemeris.py', 'cameras.py')
+# Copied as they are
+SOURCES = ('boot.py', 'main.py')
+DEFAULT_PORT = '/dev/cu.usbserial-0001'
+
+
+def mpy_cross():
+    """
+    Command to run mpy-cross
+    """
+    if shutil.which('mpy-cross'):
+        return ['mpy-cross']
+    return [sys.executable, '-m', 'mpy_cross']
+
+
+def build(directory):
+    """
+    Compile the modules into directory. Returns the files to copy
+    """
+    files = []
+    for module in MODULES:
+        target = os.path.join(directory, module[:-3] + '.mpy')
+        subprocess.run(mpy_cross() + ['-o', target, os.path.join(sim.REPO_DIR, module)],
+                       check=True)
+        files.append(target)
+    from sim import suntable
+    table = os.path.join(directory, 'ephemeris.bin')
+    suntable.write(table)
+    files.append(table)
+    return files + [os.path.join(sim.REPO_DIR, source) for source in SOURCES]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Copy the programs to the esp32 as bytecode')
+    parser.add_argument('--port', default=DEFAULT_PORT)
+    parser.add_argument('--dry-run', action='store_true', help='only compile and show the commands')
+    args = parser.parse_args(argv)
+    directory = tempfile.mkdtemp(prefix='estenopeica-mpy-')
+    try:
+        for path in build(directory):
+            name = os.path.basename(path)
+            command = ['ampy', '-p', args.port, 'put', path, '/' + name]
+            print(' '.join(command))
+            if not args.dry_run:
+                subprocess.run(command, check=True)
+        if not args.dry_run:
+            # An old .py of a module would be imported instead of its .mpy
+            for module in MODULES:
+                subprocess.run(['ampy', '-p', args.port, 'rm', '/' + module], stderr=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# Stand-in for the MicroPython framebuf module, written in pure Python.
+# It keeps the same MONO_VLSB memory layout as the C module: each byte is a
+# column of 8 vertical pixels, least significant bit on top, and the bytes
+# of a page (8 rows) follow each other from left to right.
+# scroll() and blit() move whole columns as ints, a bit per row, so they
+# take well under a millisecond for the 128x64 display.
+
+MONO_VLSB = 0
+
+# The 8x8 font built in MicroPython (font_petme128_8x8), for the characters
+# 32 to 127, 8 column bytes per character with the least significant bit on
+# top, so text is drawn pixel for pixel like on the device.
+FONT = (
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x4f\x4f\x00\x00\x00'
+    b'\x00\x07\x07\x00\x00\x07\x07\x00\x14\x7f\x7f\x14\x14\x7f\x7f\x14'
+    b'\x00\x24\x2e\x6b\x6b\x3a\x12\x00\x00\x63\x33\x18\x0c\x66\x63\x00'
+    b'\x00\x32\x7f\x4d\x4d\x77\x72\x50\x00\x00\x00\x04\x06\x03\x01\x00'
+    b'\x00\x00\x1c\x3e\x63\x41\x00\x00\x00\x00\x41\x63\x3e\x1c\x00\x00'
+    b'\x08\x2a\x3e\x1c\x1c\x3e\x2a\x08\x00\x08\x08\x3e\x3e\x08\x08\x00'
+    b'\x00\x00\x80\xe0\x60\x00\x00\x00\x00\x08\x08\x08\x08\x08\x08\x00'
+    b'\x00\x00\x00\x60\x60\x00\x00\x00\x00\x40\x60\x30\x18\x0c\x06\x02'
+    b'\x00\x3e\x7f\x49\x45\x7f\x3e\x00\x00\x40\x44\x7f\x7f\x40\x40\x00'
+    b'\x00\x62\x73\x51\x49\x4f\x46\x00\x00\x22\x63\x49\x49\x7f\x36\x00'
+    b'\x00\x18\x18\x14\x16\x7f\x7f\x10\x00\x27\x67\x45\x45\x7d\x39\x00'
+    b'\x00\x3e\x7f\x49\x49\x7b\x32\x00\x00\x03\x03\x79\x7d\x07\x03\x00'
+    b'\x00\x36\x7f\x49\x49\x7f\x36\x00\x00\x26\x6f\x49\x49\x7f\x3e\x00'
+    b'\x00\x00\x00\x24\x24\x00\x00\x00\x00\x00\x80\xe4\x64\x00\x00\x00'
+    b'\x00\x08\x1c\x36\x63\x41\x41\x00\x00\x14\x14\x14\x14\x14\x14\x00'
+    b'\x00\x41\x41\x63\x36\x1c\x08\x00\x00\x02\x03\x51\x59\x0f\x06\x00'
+    b'\x00\x3e\x7f\x41\x4d\x4f\x2e\x00\x00\x7c\x7e\x0b\x0b\x7e\x7c\x00'
+    b'\x00\x7f\x7f\x49\x49\x7f\x36\x00\x00\x3e\x7f\x41\x41\x63\x22\x00'
+    b'\x00\x7f\x7f\x41\x63\x3e\x1c\x00\x00\x7f\x7f\x49\x49\x41\x41\x00'
+    b'\x00\x7f\x7f\x09\x09\x01\x01\x00\x00\x3e\x7f\x41\x49\x7b\x3a\x00'
+    b'\x00\x7f\x7f\x08\x08\x7f\x7f\x00\x00\x00\x41\x7f\x7f\x41\x00\x00'
+    b'\x00\x20\x60\x41\x7f\x3f\x01\x00\x00\x7f\x7f\x1c\x36\x63\x41\x00'
+    b'\x00\x7f\x7f\x40\x40\x40\x40\x00\x00\x7f\x7f\x06\x0c\x06\x7f\x7f'
+    b'\x00\x7f\x7f\x0e\x1c\x7f\x7f\x00\x00\x3e\x7f\x41\x41\x7f\x3e\x00'
+    b'\x00\x7f\x7f\x09\x09\x0f\x06\x00\x00\x1e\x3f\x21\x61\x7f\x5e\x00'
+    b'\x00\x7f\x7f\x19\x39\x6f\x46\x00\x00\x26\x6f\x49\x49\x7b\x32\x00'
+    b'\x00\x01\x01\x7f\x7f\x01\x01\x00\x00\x3f\x7f\x40\x40\x7f\x3f\x00'
+    b'\x00\x1f\x3f\x60\x60\x3f\x1f\x00\x00\x7f\x7f\x30\x18\x30\x7f\x7f'
+    b'\x00\x63\x77\x1c\x1c\x77\x63\x00\x00\x07\x0f\x78\x78\x0f\x07\x00'
+    b'\x00\x61\x71\x59\x4d\x47\x43\x00\x00\x00\x7f\x7f\x41\x41\x00\x00'
+    b'\x00\x02\x06\x0c\x18\x30\x60\x40\x00\x00\x41\x41\x7f\x7f\x00\x00'
+    b'\x00\x08\x0c\x06\x06\x0c\x08\x00\xc0\xc0\xc0\xc0\xc0\xc0\xc0\xc0'
+    b'\x00\x00\x01\x03\x06\x04\x00\x00\x00\x20\x74\x54\x54\x7c\x78\x00'
+    b'\x00\x7f\x7f\x44\x44\x7c\x38\x00\x00\x38\x7c\x44\x44\x6c\x28\x00'
+    b'\x00\x38\x7c\x44\x44\x7f\x7f\x00\x00\x38\x7c\x54\x54\x5c\x58\x00'
+    b'\x00\x08\x7e\x7f\x09\x03\x02\x00\x00\x98\xbc\xa4\xa4\xfc\x7c\x00'
+    b'\x00\x7f\x7f\x04\x04\x7c\x78\x00\x00\x00\x00\x7d\x7d\x00\x00\x00'
+    b'\x00\x40\xc0\x80\x80\xfd\x7d\x00\x00\x7f\x7f\x30\x38\x6c\x44\x00'
+    b'\x00\x00\x41\x7f\x7f\x40\x00\x00\x00\x7c\x7c\x18\x30\x18\x7c\x7c'
+    b'\x00\x7c\x7c\x04\x04\x7c\x78\x00\x00\x38\x7c\x44\x44\x7c\x38\x00'
+    b'\x00\xfc\xfc\x24\x24\x3c\x18\x00\x00\x18\x3c\x24\x24\xfc\xfc\x00'
+    b'\x00\x7c\x7c\x04\x04\x0c\x08\x00\x00\x48\x5c\x54\x54\x74\x20\x00'
+    b'\x04\x04\x3f\x7f\x44\x64\x20\x00\x00\x3c\x7c\x40\x40\x7c\x3c\x00'
+    b'\x00\x1c\x3c\x60\x60\x3c\x1c\x00\x00\x1c\x7c\x30\x18\x30\x7c\x1c'
+    b'\x00\x44\x6c\x38\x38\x6c\x44\x00\x00\x9c\xbc\xa0\xa0\xfc\x7c\x00'
+    b'\x00\x44\x64\x74\x5c\x4c\x44\x00\x00\x08\x08\x3e\x77\x41\x41\x00'
+    b'\x00\x00\x00\xff\xff\x00\x00\x00\x00\x41\x41\x77\x3e\x08\x08\x00'
+    b'\x00\x02\x03\x01\x03\x02\x03\x01\xaa\x55\xaa\x55\xaa\x55\xaa\x55'
+)
+
+
+class FrameBuffer:
+    def __init__(self, buf, width, height, format=MONO_VLSB, stride=None):
+        if format != MONO_VLSB:
+            raise ValueError('only MONO_VLSB is supported')
+        self.buf = buf
+        self.width = width
+        self.height = height
+        self.stride = stride or width
+
+    def fill(self, col):
+        size = ((self.height + 7) // 8) * self.stride
+        self.buf[:size] = (b'\xff' if col else b'\x00') * size
+
+    def pixel(self, x, y, col=None):
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return None
+        index = (y >> 3) * self.stride + x
+        bit = 1 << (y & 7)
+        if col is None:
+            return 1 if self.buf[index] & bit else 0
+        if col:
+            self.buf[index] |= bit
+        else:
+            self.buf[index] &= ~bit & 0xff
+
+    def text(self, string, x, y, col=1):
+        buf = self.buf
+        stride = self.stride
+        # Rows of the characters inside the screen go straight to the buffer
+        # bytes, a column of a character covers at most two pages
+        inside = y >= 0 and y + 8 <= self.height
+        page = (y >> 3) * stride
+        shift = y & 7
+        for char in string:
+            code = ord(char)
+            if code < 32 or code > 127:
+                # Like the C module, other characters use the last glyph
+                code = 127
+            offset = (code - 32) * 8
+            for dx in range(8):
+                column = FONT[offset + dx]
+                px = x + dx
+                if not column or px < 0 or px >= self.width:
+                    continue
+                if not inside:
+                    for dy in range(8):
+                        if column & (1 << dy):
+                            self.pixel(px, y + dy, col)
+                    continue
+                low = (column << shift) & 0xff
+                high = column >> (8 - shift) if shift else 0
+                if col:
+                    buf[page + px] |= low
+                    if high:
+                        buf[page + stride + px] |= high
+                else:
+                    buf[page + px] &= ~low & 0xff
+                    if high:
+                        buf[page + stride + px] &= ~high & 0xff
+            x += 8
+
+    def column(self, x):
+        """
+        The pixels of a column as an int, bit y is the pixel of row y
+        """
+        value = 0
+        index = x
+        for page in range((self.height + 7) >> 3):
+            value |= self.buf[index] << (page << 3)
+            index += self.stride
+        return value
+
+    def set_column(self, x, value, mask):
+        """
+        Change the pixels of a column that are in mask to the ones of value
+        """
+        buf = self.buf
+        index = x
+        for page in range((self.height + 7) >> 3):
+            bits = (mask >> (page << 3)) & 0xff
+            if bits:
+                buf[index] = (buf[index] & ~bits & 0xff) | ((value >> (page << 3)) & bits)
+            index += self.stride
+
+    def scroll(self, dx, dy):
+        # Whole columns are moved as ints. What is left behind is not
+        # cleared, like in the C module
+        width = self.width
+        full = (1 << self.height) - 1
+        if dy >= 0:
+            mask = (full << dy) & full
+        else:
+            mask = full >> -dy
+        columns = [self.column(x) for x in range(width)]
+        for x in range(max(dx, 0), min(width + dx, width)):
+            column = columns[x - dx]
+            column = column << dy if dy >= 0 else column >> -dy
+            self.set_column(x, column, mask)
+
+    def blit(self, fbuf, x, y, key=-1):
+        # A column of the source at a time, shifted to its rows
+        full = (1 << self.height) - 1
+        area = ((1 << fbuf.height) - 1) << y if y >= 0 else ((1 << fbuf.height) - 1) >> -y
+        area &= full
+        for sx in range(max(0, -x), min(fbuf.width, self.width - x)):
+            column = fbuf.column(sx)
+            column = column << y if y >= 0 else column >> -y
+            if key == 0:
+                mask = area & column
+            elif key == 1:
+                mask = area & ~column
+            else:
+                mask = area
+            if mask:
+                self.set_column(x + sx, column, mask)
+
+
+def FrameBuffer1(buf, width, height, stride=None):
+    return FrameBuffer(buf, width, height, MONO_VLSB, stride)
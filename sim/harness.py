@@ -0,0 +1,430 @@
+# Run the real main.py on the host against the simulated world, for days or
+# years of virtual time, and report what it did: exposures and their timing
+# error, bus traffic, publishes, radio-on time, and so on.
+#
+# Every wake up runs main.py from the start with fresh modules, like the
+# esp32 does after deep sleep. The RTC, its memory and the files stay.
+# --set changes the settings in config.py.
+#
+# Usage:
+#   python -m sim.harness [--days 365] [--set NAME=VALUE ...] [--outage START_DAY:HOURS]
+#                         [--fault DAY:error|reset] [--ephemeris] [--epoch 1970|2000] [--check]
+#
+# --epoch 2000 runs the program with the time counted from 2000-01-01, like
+# the esp32, to check the tools that read what it leaves (logreader.py).
+#
+# --check exits with 1 if the openings in a network outage were later than
+# the others, the pictures must not wait for the WiFi, or if humidity
+# reports were dropped by the telemetry instead of sent after the outage.
+
+import argparse
+import ast
+import contextlib
+import importlib.abc
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import sim
+from sim import world as world_module
+from sim import vtime
+
+# 2025-01-01 00:00:00 UTC
+DEFAULT_START = 1735689600
+# Seconds that an opening in an outage may be later than the others, the
+# log has the seconds of the RTC
+LATENCY_TOLERANCE = 1
+# Epochs of time.time(), by year, in seconds since 1970-01-01
+EPOCHS = {1970: 0, 2000: 946684800}
+# Modules of the program that main.py starts. What the report reads of the
+# program (the settings, its state, the telemetry) is in their globals
+PROGRAM = ('config', 'wake', 'program')
+
+
+class RepoFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Import the modules of the repository compiling them only once. They are
+    imported again at each wake up, and the host may not keep .pyc files.
+    sources has the source of some modules by name, instead of their file
+    """
+    def __init__(self, sources=None):
+        self.code = {}
+        self.sources = sources or {}
+        # Globals of the modules imported since the last forget(), by name.
+        # Also of the ones that did not finish, like wake.py going to sleep
+        self.namespaces = {}
+
+    def find_spec(self, name, path=None, target=None):
+        filename = os.path.join(sim.REPO_DIR, name + '.py')
+        if path is not None or not os.path.exists(filename):
+            return None
+        return importlib.util.spec_from_file_location(name, filename, loader=self)
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        filename = module.__spec__.origin
+        if filename not in self.code:
+            source = self.sources.get(module.__name__)
+            if source is None:
+                with open(filename) as f:
+                    source = f.read()
+            self.code[filename] = compile(source, filename, 'exec')
+        self.namespaces[module.__name__] = module.__dict__
+        exec(self.code[filename], module.__dict__)
+
+    def forget(self):
+        """
+        Unload the modules of the repository, like the esp32 after deep sleep.
+        Also the ones that the tools of sim imported without the finder
+        """
+        for name, module in list(sys.modules.items()):
+            if (getattr(module, '__loader__', None) is self
+                    or os.path.dirname(getattr(module, '__file__', None) or '') == sim.REPO_DIR):
+                del sys.modules[name]
+        self.namespaces = {}
+
+
+def patch_config(source, overrides):
+    """
+    Change the value of module level assignments (NAME = value) of config.py.
+    The whole assignment is replaced, also when it takes several lines
+    """
+    for name, value in overrides.items():
+        lines = source.split('\n')
+        for node in ast.parse(source).body:
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                    and isinstance(node.targets[0], ast.Name) and node.targets[0].id == name):
+                lines[node.lineno - 1:node.end_lineno] = ['{} = {}'.format(name, value)]
+                break
+        else:
+            raise ValueError('config.py has no setting {}'.format(name))
+        source = '\n'.join(lines)
+    return source
+
+
+class Simulation:
+    def __init__(self, days=365, start=DEFAULT_START, overrides=None, outages=(),
+                 rtc_drift_ppm=30, seed=1, faults=(), ephemeris=False, epoch=0):
+        self.days = days
+        # Put the table of the sun in the flash, see suntable.py
+        self.ephemeris = ephemeris
+        # Optional callable(addr, data) for every I2C write, see snapshot.py
+        self.i2c_listener = None
+        self.faults = faults
+        # Epoch of time.time() in the program, in seconds since 1970-01-01
+        self.epoch = epoch
+        self.start = start
+        self.overrides = overrides or {}
+        self.outages = outages
+        self.rtc_drift_ppm = rtc_drift_ppm
+        self.seed = seed
+        self.world = None
+        # Globals of the modules of the program (PROGRAM) in the last wake up
+        self.main = {}
+        self.exit = None
+        # Records of the log that the program left, see logreader.py
+        self.records = []
+        # What the program printed
+        self.console = io.StringIO()
+
+    def install(self):
+        """
+        Put the stand-in modules in place of the MicroPython ones
+        """
+        sim.install()
+        self.saved_time = sys.modules['time']
+        sys.modules['time'] = vtime
+        self.finder = RepoFinder({'config': self.config_source})
+        sys.meta_path.insert(0, self.finder)
+
+    def uninstall(self):
+        sys.modules['time'] = self.saved_time
+        self.finder.forget()
+        sys.meta_path.remove(self.finder)
+        world_module.world = None
+
+    def write_files(self, directory):
+        """
+        Files the program expects in the flash
+        """
+        with open(os.path.join(directory, 'wifi-credentials.txt'), 'w') as f:
+            f.write("WIFI_SSID = '{}'\nWIFI_PASSWORD = '{}'\n".format(self.world.ssid, self.world.password))
+        with open(os.path.join(directory, 'adafruit-credentials.txt'), 'w') as f:
+            f.write('aio_key\n')
+
+    def run(self):
+        """
+        Run the simulation and return the report
+        """
+        end = self.start + self.days * 86400
+        outages = [(self.start + day * 86400, self.start + day * 86400 + hours * 3600)
+                   for day, hours in self.outages]
+        faults = [(self.start + day * 86400, kind) for day, kind in self.faults]
+        self.world = world_module.World(self.start, end, self.rtc_drift_ppm, outages, self.seed,
+                                        faults=faults, epoch=self.epoch)
+        self.world.i2c_listener = self.i2c_listener
+        world_module.world = self.world
+        with open(os.path.join(sim.REPO_DIR, 'config.py')) as f:
+            self.config_source = patch_config(f.read(), self.overrides)
+        with open(os.path.join(sim.REPO_DIR, 'main.py')) as f:
+            code = compile(f.read(), 'main.py', 'exec')
+        directory = tempfile.mkdtemp(prefix='estenopeica-')
+        # config.py with the settings changed, for the tools that read them
+        self.config_path = os.path.join(directory, 'config-settings.py')
+        with open(self.config_path, 'w') as f:
+            f.write(self.config_source)
+        if self.ephemeris:
+            # Before the stand-in time module is in place
+            from sim import suntable
+            suntable.write(os.path.join(directory, 'ephemeris.bin'), self.config_path)
+        cwd = os.getcwd()
+        started = time.perf_counter()
+        self.install()
+        try:
+            os.chdir(directory)
+            self.write_files(directory)
+            with contextlib.redirect_stdout(self.console):
+                self.loop(code)
+        finally:
+            self.uninstall()
+            os.chdir(cwd)
+            self.log = self.read_log(directory)
+            shutil.rmtree(directory)
+        self.wall_time = time.perf_counter() - started
+        return self.report()
+
+    def loop(self, code):
+        """
+        Run main.py, again after every deep sleep, until the end of the simulation
+        """
+        try:
+            while True:
+                self.finder.forget()
+                try:
+                    exec(code, {'__name__': '__main__', '__file__': 'main.py'})
+                except world_module.DeepSleep as sleep:
+                    self.world.deep_sleep(sleep.ms)
+                    continue
+                except world_module.Reset as reset:
+                    self.world.reset(reset.cause)
+                    continue
+                except SystemExit as e:
+                    self.exit = 'sys.exit({})'.format(e.code)
+                except Exception as e:
+                    # The program ended by an error. Only the watchdog can reset it
+                    print('Traceback: {}: {}'.format(type(e).__name__, e))
+                    if self.world.watchdog:
+                        self.world.timers = {}
+                        try:
+                            self.world.advance(self.world.watchdog[1] - self.world.now)
+                        except world_module.Reset as reset:
+                            self.world.reset(reset.cause)
+                            continue
+                    self.exit = 'error {}'.format(type(e).__name__)
+                return
+        except world_module.SimulationEnd:
+            pass
+        finally:
+            self.main = self.program_globals()
+
+    def program_globals(self):
+        """
+        The globals of the modules of the program of the last wake up, merged
+        """
+        merged = {}
+        for name in PROGRAM:
+            merged.update(self.finder.namespaces.get(name, {}))
+        return merged
+
+    def read_log(self, directory):
+        """
+        Summary of the log that the program left in the flash, see logreader.py
+        """
+        from sim import logreader
+        self.records, epoch = logreader.read(directory)
+        return logreader.summary(self.records, logreader.camera_schedules(self.main),
+                                 self.main.get('UTC_OFFSET', 0), self.main.get('OPENING_GRACE', 3600), epoch)
+
+    def cameras(self):
+        """
+        (servo pin, schedules) of each camera of main.py. The pin is None if
+        main.py has only SCHEDULES
+        """
+        if 'CAMERAS' in self.main:
+            return [(camera['pin'], camera['schedules']) for camera in self.main['CAMERAS']]
+        if 'SCHEDULES' in self.main:
+            return [(None, self.main['SCHEDULES'])]
+        return []
+
+    def scheduled_openings(self, schedules):
+        """
+        Openings (UTC seconds) that a schedule of main.py asks in the simulated time
+        """
+        import schedule
+        from sim import logreader
+        schedules = logreader.unix_schedules(schedules, self.epoch)
+        offset = self.main.get('UTC_OFFSET', 0)
+        openings = []
+        now = self.start + offset
+        while True:
+            now = schedule.next_opening(now, schedules)
+            if now - offset >= self.world.end:
+                return openings
+            openings.append(now - offset)
+            now += 1
+
+    def published_reports(self):
+        """
+        Humidity samples that reached the broker
+        """
+        feed = self.main.get('FEED_HUM')
+        return sum(1 for _, _, msg in self.world.publishes if feed in json.loads(msg).get('feeds', {}))
+
+    def unsent_reports(self):
+        """
+        Humidity samples still waiting in the telemetry at the end
+        """
+        telem = self.main.get('telem')
+        if telem is None:
+            return 0
+        return sum(1 for n in range(telem.count)
+                   if telem.feeds[(telem.head + n) % telem.size] == self.main.get('FEED_HUM'))
+
+    def report(self):
+        """
+        What happened in the simulation, as a dict
+        """
+        world = self.world
+        # Pair the servo moves of each pin in exposures
+        exposures = []
+        opened = {}
+        for when, pin, position in world.servo_moves:
+            if position == 'open':
+                opened[pin] = when
+            elif pin in opened:
+                start = opened.pop(pin)
+                exposures.append((start, when - start, pin))
+        grace = self.main.get('OPENING_GRACE', 3600)
+        scheduled = 0
+        errors = []
+        missed = 0
+        for camera_pin, schedules in self.cameras():
+            for opening in self.scheduled_openings(schedules):
+                scheduled += 1
+                taken = [start for start, _, pin in exposures
+                         if opening - grace <= start < opening + grace and camera_pin in (None, pin)]
+                if taken:
+                    errors.append(min(taken, key=lambda start: abs(start - opening)) - opening)
+                else:
+                    missed += 1
+        durations = [duration for _, duration, _ in exposures]
+        # How late the program opened each one, from the log, in and out of
+        # the outages. The ones that a reset cut are left out
+        from sim import logreader
+        latency = {'online': [], 'outage': []}
+        for record in self.records:
+            if record[1] == logreader.flashlog.EXPOSURE and not record[2] & 1:
+                offline = any(start <= record[0] < end for start, end in world.outages)
+                latency['outage' if offline else 'online'].append(record[6] / 1000)
+        return {
+            'days': self.days,
+            'wall_seconds': round(self.wall_time, 3),
+            'end': self.exit or 'completed',
+            'console_lines': self.console.getvalue().count('\n'),
+            'wakes': world.wakes,
+            'resets': world.resets,
+            'awake_seconds': round(world.awake_time, 3),
+            'radio_seconds': round(world.radio_time, 3),
+            'servo_seconds': round(world.servo_time, 3),
+            'sleep_seconds': round(world.sleep_time, 3),
+            'exposures': len(exposures),
+            'scheduled_openings': scheduled,
+            'missed_openings': missed,
+            'timing_error_mean': round(sum(abs(e) for e in errors) / len(errors), 3) if errors else None,
+            'timing_error_max': round(max(abs(e) for e in errors), 3) if errors else None,
+            'exposure_min': round(min(durations), 3) if durations else None,
+            'exposure_max': round(max(durations), 3) if durations else None,
+            'exposure_jitter': round(max(durations) - min(durations), 3) if durations else None,
+            'latency_max_online': max(latency['online']) if latency['online'] else None,
+            'latency_max_outage': max(latency['outage']) if latency['outage'] else None,
+            'i2c_transactions': world.i2c_transactions,
+            'i2c_bytes': world.i2c_bytes,
+            'publishes': len(world.publishes),
+            'mqtt_connects': world.mqtt_connects,
+            'wifi_connects': world.wifi_connects,
+            'wifi_scans': world.wifi_scans,
+            'ntp_queries': world.ntp_queries,
+            'log_records': self.log['records'],
+            'log_exposures': self.log['events'].get('exposure', 0),
+            'log_missed': len(self.log['missed']) if 'missed' in self.log else None,
+            'reports': self.main['state']['reports'] if 'state' in self.main else None,
+            'published_reports': self.published_reports(),
+            'unsent_reports': self.unsent_reports(),
+        }
+
+
+def check(report):
+    """
+    Problems of a report. The openings in an outage can not be later than
+    the others, give or take the second of the RTC, and every humidity
+    report must reach the broker or be still waiting to be sent
+    """
+    problems = []
+    online, outage = report['latency_max_online'], report['latency_max_outage']
+    if outage is not None and outage > (online or 0) + LATENCY_TOLERANCE:
+        problems.append('openings in outages {} s late, {} s otherwise'.format(outage, online))
+    if report['reports'] is not None:
+        lost = report['reports'] - report['published_reports'] - report['unsent_reports']
+        if lost > 0:
+            problems.append('{} of {} humidity reports lost by the telemetry'.format(lost, report['reports']))
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run main.py in a simulated world')
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--start', type=int, default=DEFAULT_START, help='UTC seconds')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='change a setting of config.py, for example DEEP_SLEEP=False')
+    parser.add_argument('--outage', action='append', default=[], metavar='DAY:HOURS',
+                        help='the network is down from that day for that many hours')
+    parser.add_argument('--fault', action='append', default=[], metavar='DAY:KIND',
+                        help='at that day, an error in the program (error) or a reset (reset)')
+    parser.add_argument('--ephemeris', action='store_true',
+                        help='exposures that follow the sun, with the table of suntable.py')
+    parser.add_argument('--drift', type=float, default=30, help='RTC drift in ppm')
+    parser.add_argument('--epoch', type=int, choices=sorted(EPOCHS), default=1970,
+                        help='year the time of the program counts from, 2000 in the esp32')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--console', action='store_true', help='show what the program printed')
+    parser.add_argument('--check', action='store_true',
+                        help='fail if the openings in the outages were later than the others, '
+                             'or humidity reports were lost')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = dict(setting.split('=', 1) for setting in args.set)
+    outages = [tuple(float(v) for v in outage.split(':')) for outage in args.outage]
+    faults = [(float(fault.split(':')[0]), fault.split(':')[1]) for fault in args.fault]
+    simulation = Simulation(args.days, args.start, overrides, outages, args.drift, args.seed, faults,
+                            args.ephemeris, EPOCHS[args.epoch])
+    report = simulation.run()
+    if args.console:
+        print(simulation.console.getvalue(), end='')
+    print(json.dumps(report, indent=2))
+    if args.check and check(report):
+        print('\n'.join(check(report)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# Read the log that flashlog.py writes in the flash of the esp32, summarise
+# it and check that every opening of the schedule of each camera has its
+# exposure.
+#
+# Copy the log-*.bin files from the esp32 (ampy get) to a directory and run
+# the reader on it. The schedule is taken from config.py.
+#
+# The esp32 counts the time from 2000-01-01, the reader converts it to
+# seconds since 1970-01-01 with the EPOCH record at the start of each
+# segment. The segments written before there was one are from an esp32.
+#
+# Usage:
+#   python -m sim.logreader DIRECTORY [--config config.py]
+
+import argparse
+import ast
+import json
+import os
+import struct
+import sys
+import time
+
+import sim
+sim.install()
+
+import flashlog
+import schedule
+
+FIELDS = ('time', 'event', 'extra', 'humidity', 'spread', 'exposure', 'latency')
+# 2000-01-01, the epoch of the esp32, in seconds since 1970-01-01
+ESP32_EPOCH = 946684800
+EVENTS = {flashlog.BOOT: 'boot', flashlog.REPORT: 'report', flashlog.EXPOSURE: 'exposure'}
+
+
+def read(directory):
+    """
+    Read all the segments of a directory, the oldest first. Returns the
+    records as tuples of FIELDS, with the times in seconds since 1970-01-01,
+    and the epoch of the device
+    """
+    records = []
+    epoch = ESP32_EPOCH
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(flashlog.PREFIX) and name.endswith(flashlog.SUFFIX))
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            data = f.read()
+        # A record cut by a power loss is left out
+        data = data[:len(data) - len(data) % flashlog.RECORD_SIZE]
+        for record in struct.iter_unpack(flashlog.RECORD, data):
+            if record[1] == flashlog.EPOCH:
+                epoch = record[0]
+            else:
+                records.append((record[0] + epoch,) + record[1:])
+    return records, epoch
+
+
+def values(path, names):
+    """
+    Get some settings of config.py as a dict, evaluating its module level
+    assignments in order without running it. The ones not found are left out
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    namespace = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            continue
+        try:
+            namespace[node.targets[0].id] = eval(compile(ast.Expression(node.value), path, 'eval'), {}, namespace)
+        except Exception:
+            continue
+        if all(name in namespace for name in names):
+            break
+    return {name: namespace[name] for name in names if name in namespace}
+
+
+def camera_schedules(namespace):
+    """
+    The schedules of each camera of config.py, from CAMERAS or SCHEDULES if it
+    has only one. None if there are none
+    """
+    if 'CAMERAS' in namespace:
+        return [camera['schedules'] for camera in namespace['CAMERAS']]
+    if 'SCHEDULES' in namespace:
+        return [namespace['SCHEDULES']]
+    return None
+
+
+def settings(path):
+    """
+    Get the schedules of each camera, UTC_OFFSET and OPENING_GRACE from config.py
+    """
+    found = values(path, ('SCHEDULES', 'CAMERAS', 'UTC_OFFSET', 'OPENING_GRACE'))
+    return camera_schedules(found), found.get('UTC_OFFSET', 0), found.get('OPENING_GRACE', 3600)
+
+
+def unix_schedules(schedules, epoch):
+    """
+    The schedules of a device with another epoch, for times since
+    1970-01-01. Only the start of the days counted with 'every' depends on
+    the epoch, the days of the week come from the time module
+    """
+    return tuple(dict(schedule, start=schedule.get('start', 0) + epoch) for schedule in schedules)
+
+
+def scheduled_openings(schedules, utc_offset, start, end):
+    """
+    Openings (UTC seconds) of the schedules from start to end
+    """
+    openings = []
+    now = start + utc_offset
+    while True:
+        now = schedule.next_opening(now, schedules)
+        if now - utc_offset > end:
+            return openings
+        openings.append(now - utc_offset)
+        now += 1
+
+
+def iso(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def stats(values):
+    """
+    Minimum, mean and maximum of some numbers, None if there are none
+    """
+    if not values:
+        return None
+    return {'min': min(values), 'mean': round(sum(values) / len(values), 3), 'max': max(values)}
+
+
+def opening_name(camera, seconds):
+    """
+    An opening as text, with the camera if it is not the first
+    """
+    if camera:
+        return '{} camera {}'.format(iso(seconds), camera)
+    return iso(seconds)
+
+
+def summary(records, cameras=None, utc_offset=0, grace=3600, epoch=0):
+    """
+    Summary of the records as a dict. With the schedules of the cameras, also
+    the openings that have no exposure, the ones with more than one and the
+    exposures that were not scheduled. The times are since 1970-01-01, epoch
+    is the one of the device
+    """
+    by_event = {event: [] for event in EVENTS}
+    for record in records:
+        by_event.setdefault(record[1], []).append(record)
+    reports = by_event[flashlog.REPORT]
+    exposures = by_event[flashlog.EXPOSURE]
+    result = {
+        'records': len(records),
+        'first': iso(records[0][0]) if records else None,
+        'last': iso(records[-1][0]) if records else None,
+        'events': {EVENTS.get(event, str(event)): len(found) for event, found in by_event.items()},
+        'humidity': stats([r[3] for r in reports]),
+        'humidity_spread': stats([r[4] for r in reports]),
+        'boot_ms': stats([r[6] for r in reports if r[6]]),
+        'exposure_ms': stats([r[5] for r in exposures]),
+        'exposure_latency_ms': stats([r[6] for r in exposures]),
+    }
+    if cameras is not None and records:
+        # An opening at the end may still be open, it only counts after the grace
+        expected = [(camera, t) for camera, schedules in enumerate(cameras)
+                    for t in scheduled_openings(unix_schedules(schedules, epoch), utc_offset,
+                                                records[0][0], records[-1][0] - grace)]
+        # (camera, time) of the exposures. The camera is in the extra
+        taken = {}
+        for record in exposures:
+            key = (record[2] >> 1, record[0])
+            taken[key] = taken.get(key, 0) + 1
+        wanted = set(expected)
+        result['scheduled'] = len(expected)
+        result['missed'] = [opening_name(*key) for key in expected if key not in taken]
+        result['duplicated'] = [opening_name(*key) for key, count in sorted(taken.items()) if count > 1]
+        result['unscheduled'] = [opening_name(*key) for key in sorted(taken) if key not in wanted]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarise the log of the esp32')
+    parser.add_argument('directory', help='directory with the log-*.bin files')
+    parser.add_argument('--config', default=os.path.join(sim.REPO_DIR, 'config.py'),
+                        help='config.py with the schedule to check')
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    records, epoch = read(args.directory)
+    cameras, utc_offset, grace = settings(args.config)
+    result = summary(records, cameras, utc_offset, grace, epoch)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    print(json.dumps(result, indent=2))
+    if result.get('missed') or result.get('duplicated'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+# Stand-in for the MicroPython machine module. The buses record every
+# transaction so the traffic of the drivers can be counted. Inside a
+# simulation (see harness.py) everything also acts on the simulated world:
+# bus transfers take time, the RTC drifts, and so on.
+
+import calendar
+import time as _time
+
+from sim import world as _world
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+
+def reset_cause():
+    return _world.world.reset_cause if _world.world else PWRON_RESET
+
+
+def deepsleep(ms=0):
+    raise _world.DeepSleep(ms)
+
+
+def reset():
+    # Like the esp32, a software reset
+    raise _world.Reset(SOFT_RESET)
+
+
+def lightsleep(ms=0):
+    _world.world.advance(ms / 1000)
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def unique_id():
+    return b'\x24\x0a\xc4\x00\x00\x01'
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self._value = value
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def high(self):
+        self._value = 1
+
+    def low(self):
+        self._value = 0
+
+    on = high
+    off = low
+
+
+class I2C:
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+        self.freq = freq
+        # Number of writes and bytes sent, including the address byte
+        self.transactions = 0
+        self.bytes = 0
+        # Optional callable(addr, data) that gets every write
+        self.listener = None
+
+    def writeto(self, addr, buf, stop=True):
+        self.transactions += 1
+        self.bytes += len(buf) + 1
+        if self.listener:
+            self.listener(addr, bytes(buf))
+        if _world.world:
+            _world.world.i2c_transactions += 1
+            _world.world.i2c_bytes += len(buf) + 1
+            if _world.world.i2c_listener:
+                _world.world.i2c_listener(addr, bytes(buf))
+            # 9 clocks per byte, with the ack
+            _world.world.advance((len(buf) + 1) * 9 / self.freq)
+        return len(buf)
+
+
+class SPI:
+    def __init__(self, id=1, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.baudrate = baudrate
+        self.inits = 0
+        self.transactions = 0
+        self.bytes = 0
+        self.listener = None
+
+    def init(self, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.baudrate = baudrate
+        self.inits += 1
+
+    def write(self, buf):
+        self.transactions += 1
+        self.bytes += len(buf)
+        if self.listener:
+            self.listener(bytes(buf))
+        if _world.world:
+            _world.world.spi_transactions += 1
+            _world.world.spi_bytes += len(buf)
+            _world.world.advance(len(buf) * 8 / self.baudrate)
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+    WIDTH_12BIT = 3
+
+    def __init__(self, pin, atten=None):
+        self.pin = pin
+
+    def atten(self, atten):
+        pass
+
+    def width(self, width):
+        pass
+
+    def read(self):
+        # A conversion takes some microseconds
+        _world.world.advance(0.00005)
+        return _world.world.humidity()
+
+    def read_u16(self):
+        return self.read() << 4
+
+
+class PWM:
+    def __init__(self, pin, freq=50, duty=None, duty_ns=None, duty_u16=None):
+        self.pin = pin
+        self._freq = freq
+        self.pulse_us = None
+        if duty is not None:
+            self.duty(duty)
+        if duty_ns is not None:
+            self.duty_ns(duty_ns)
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def init(self, freq=None, duty=None, duty_ns=None, duty_u16=None):
+        self.__init__(self.pin, freq or self._freq, duty, duty_ns, duty_u16)
+
+    def freq(self, freq=None):
+        if freq is None:
+            return self._freq
+        self._freq = freq
+
+    def set_pulse(self, pulse_us):
+        self.pulse_us = pulse_us
+        if _world.world:
+            _world.world.servo_pulse(self.pin.id, pulse_us)
+
+    def duty(self, duty=None):
+        # 10 bits of the period
+        if duty is None:
+            return round((self.pulse_us or 0) * self._freq * 1023 / 1000000)
+        self.set_pulse(duty * 1000000 / self._freq / 1023)
+
+    def duty_u16(self, duty=None):
+        if duty is None:
+            return round((self.pulse_us or 0) * self._freq * 65535 / 1000000)
+        self.set_pulse(duty * 1000000 / self._freq / 65535)
+
+    def duty_ns(self, duty=None):
+        if duty is None:
+            return round((self.pulse_us or 0) * 1000)
+        self.set_pulse(duty / 1000)
+
+    def deinit(self):
+        self.set_pulse(None)
+
+
+class Timer:
+    """
+    Hardware timer. The callback is called on the virtual clock, in the
+    middle of whatever the program is doing, like an interrupt
+    """
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self.callback = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        if freq is not None:
+            period = 1000 / freq
+        self.callback = callback
+        period = period / 1000
+        _world.world.timers[self] = (_world.world.now + period, period if mode == Timer.PERIODIC else None)
+
+    def deinit(self):
+        _world.world.timers.pop(self, None)
+
+    def fire(self):
+        if self.callback:
+            self.callback(self)
+
+
+class WDT:
+    """
+    Watchdog. If it is not fed in timeout ms, the esp32 is reset. Once
+    started it can not be stopped, only deep sleep or a reset stop it
+    """
+    def __init__(self, id=0, timeout=5000):
+        _world.world.feed_watchdog(timeout / 1000)
+
+    def feed(self):
+        _world.world.feed_watchdog()
+
+
+class RTC:
+    def datetime(self, value=None):
+        if value is None:
+            seconds = _world.world.device_time()
+            t = _time.gmtime(int(seconds))
+            return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday + 1, t.tm_hour, t.tm_min, t.tm_sec,
+                    int((seconds % 1) * 1000000))
+        seconds = calendar.timegm((value[0], value[1], value[2], value[4], value[5], value[6], 0, 0, 0))
+        _world.world.set_device_time(seconds + value[7] / 1000000)
+
+    def memory(self, data=None):
+        if data is None:
+            return _world.world.rtc_memory
+        if len(data) > 2048:
+            raise ValueError('buffer too long')
+        _world.world.rtc_memory = bytes(data, 'utf-8') if isinstance(data, str) else bytes(data)
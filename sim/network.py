@@ -0,0 +1,99 @@
+# Stand-in for the MicroPython network module, with one access point in the
+# simulated world. Connecting takes time like on the esp32: a scan when the
+# access point is not given, the association, and DHCP if there is no
+# static IP.
+
+from sim import world as _world
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+
+# Seconds that each part of a connection takes
+SCAN_TIME = 2.0
+ASSOCIATION_TIME = 0.5
+DHCP_TIME = 1.5
+
+DHCP_CONFIG = ('192.168.1.50', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+
+
+def WLAN(interface=STA_IF):
+    # One object per interface and wake up
+    world = _world.world
+    if interface not in world.interfaces:
+        world.interfaces[interface] = _WLAN(interface)
+    return world.interfaces[interface]
+
+
+class _WLAN:
+    def __init__(self, interface):
+        self.interface = interface
+        self._active = False
+        self.static = None
+        self.ready_at = None
+        self._channel = None
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+        if self.interface == STA_IF:
+            _world.world.radio_on = self._active
+        if not self._active:
+            self.ready_at = None
+
+    def scan(self):
+        world = _world.world
+        world.wifi_scans += 1
+        world.advance(SCAN_TIME)
+        if not world.online():
+            return []
+        return [(world.ssid.encode(), world.bssid, world.channel, -60, 3, False)]
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        world = _world.world
+        world.wifi_connects += 1
+        if ssid != world.ssid or key != world.password:
+            self.ready_at = None
+            return
+        delay = ASSOCIATION_TIME
+        if bssid is None or bssid != world.bssid:
+            # The esp32 scans by itself to find the access point
+            delay += SCAN_TIME
+        if self.static is None:
+            delay += DHCP_TIME
+        self.ready_at = world.now + delay
+
+    def disconnect(self):
+        self.ready_at = None
+
+    def isconnected(self):
+        world = _world.world
+        return (self._active and self.ready_at is not None and world.now >= self.ready_at
+                and world.online())
+
+    def status(self, param=None):
+        if param == 'rssi':
+            return -60
+        if self.isconnected():
+            return STAT_GOT_IP
+        return STAT_CONNECTING if self.ready_at is not None else STAT_IDLE
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self.static or DHCP_CONFIG
+        self.static = None if config == 'dhcp' else tuple(config)
+
+    def config(self, *args, **kwargs):
+        if 'channel' in kwargs:
+            self._channel = kwargs['channel']
+        if args:
+            if args[0] == 'channel':
+                return self._channel or _world.world.channel
+            if args[0] == 'mac':
+                return b'\x24\x0a\xc4\x00\x00\x01'
+            if args[0] == 'essid':
+                return _world.world.ssid
@@ -0,0 +1,33 @@
+# Stand-in for the MicroPython ntptime module. The servers answer with the
+# true time of the simulated world, if the network is up.
+
+from sim import world as _world
+
+host = 'pool.ntp.org'
+timeout = 1
+
+# Seconds that a query takes when the server answers
+QUERY_TIME = 0.05
+
+
+def _connected():
+    from sim import network
+    return network.WLAN(network.STA_IF).isconnected()
+
+
+def time():
+    world = _world.world
+    world.ntp_queries += 1
+    if not _connected():
+        raise OSError(-202)
+    if not world.online():
+        world.advance(timeout)
+        raise OSError(110)
+    world.advance(QUERY_TIME)
+    # Since the epoch of the port, like MicroPython
+    return int(world.now) - world.epoch
+
+
+def settime():
+    world = _world.world
+    world.set_device_time(time() + world.epoch)
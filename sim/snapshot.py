@@ -0,0 +1,242 @@
+# Pictures of what the display shows, to see and check the screens of
+# main.py without the esp32.
+#
+# The display is rebuilt from the I2C writes of the SSD1306 driver (Glass),
+# so what is checked is what the glass shows after the partial updates of
+# ssd1306.py, not only what was drawn in the framebuffer. main.py runs in the
+# simulated world (see harness.py) and every different screen is kept as a
+# PNG, written with zlib, with an index.json of when each one was first seen
+# and how many times.
+#
+# Save the screens of a commit with --save and check a later one against
+# them with --compare, which lists the screens that are new or gone and
+# exits with 1 if there are any.
+#
+# Usage:
+#   python -m sim.snapshot [--days 2] [--set NAME=VALUE ...] [--save DIR] [--compare DIR]
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+
+from sim import harness
+from sim import world as world_module
+
+# Writes closer in time than this are one show(). A full frame at 450 kHz
+# takes about 20 ms
+FRAME_WINDOW = 0.05
+# Arguments of the commands of the SSD1306 that have them
+COMMAND_ARGS = {0x20: 1, 0x21: 2, 0x22: 2, 0x81: 1, 0x8d: 1, 0xa8: 1, 0xd3: 1, 0xd5: 1,
+                0xd9: 1, 0xda: 1, 0xdb: 1}
+
+
+class Glass:
+    """
+    The RAM of an SSD1306 in horizontal addressing mode, rebuilt from the
+    I2C writes. on_frame(time, frame) gets each frame once it was shown
+    """
+    def __init__(self, width=128, height=64, addr=0x3c, clock=None, on_frame=None):
+        self.width = width
+        self.pages = height // 8
+        self.height = height
+        self.addr = addr
+        self.ram = bytearray(width * self.pages)
+        self.on = False
+        self.inverted = False
+        self.window = (0, width - 1, 0, self.pages - 1)
+        self.column = 0
+        self.page = 0
+        # Command waiting for its arguments, and the arguments so far
+        self.command = None
+        self.args = []
+        self.clock = clock or (lambda: world_module.world.now)
+        self.on_frame = on_frame
+        self.last_write = None
+
+    def frame(self):
+        """
+        What the display shows, in the MONO_VLSB layout of the RAM
+        """
+        if not self.on:
+            return bytes(len(self.ram))
+        if self.inverted:
+            return bytes(~byte & 0xff for byte in self.ram)
+        return bytes(self.ram)
+
+    def flush(self):
+        """
+        Give the frame shown to on_frame, at the end of a show()
+        """
+        if self.last_write is not None and self.on_frame:
+            self.on_frame(self.last_write, self.frame())
+        self.last_write = None
+
+    def write(self, addr, data):
+        """
+        An I2C write. The first byte is the control byte
+        """
+        if addr != self.addr or not data:
+            return
+        now = self.clock()
+        if self.last_write is not None and now - self.last_write > FRAME_WINDOW:
+            self.flush()
+        self.last_write = now
+        control = data[0]
+        if control & 0x40:
+            self.data(data[1:])
+        elif control & 0x80:
+            # Co=1: one command, then another control byte
+            self.commands(data[1:2])
+            if len(data) > 2:
+                self.write(addr, data[2:])
+        else:
+            self.commands(data[1:])
+
+    def commands(self, data):
+        for byte in data:
+            if self.command is not None:
+                self.args.append(byte)
+            else:
+                self.command = byte
+                self.args = []
+            if len(self.args) < COMMAND_ARGS.get(self.command, 0):
+                continue
+            self.run(self.command, self.args)
+            self.command = None
+
+    def run(self, command, args):
+        if command == 0x21:
+            self.window = (args[0], args[1], self.window[2], self.window[3])
+            self.column = args[0]
+        elif command == 0x22:
+            self.window = (self.window[0], self.window[1], args[0], args[1])
+            self.page = args[0]
+        elif command in (0xae, 0xaf):
+            self.on = command == 0xaf
+        elif command in (0xa6, 0xa7):
+            self.inverted = command == 0xa7
+
+    def data(self, data):
+        x0, x1, p0, p1 = self.window
+        for byte in data:
+            if self.column < self.width and self.page < self.pages:
+                self.ram[self.page * self.width + self.column] = byte
+            self.column += 1
+            if self.column > x1:
+                self.column = x0
+                self.page += 1
+                if self.page > p1:
+                    self.page = p0
+
+
+def png(frame, width, height, scale=1):
+    """
+    A MONO_VLSB frame as a black and white PNG, each pixel scale times bigger
+    """
+    rows = []
+    for y in range(height):
+        index = (y >> 3) * width
+        bit = 1 << (y & 7)
+        row = bytearray(1 + (width * scale + 7) // 8)
+        for x in range(width):
+            if frame[index + x] & bit:
+                for i in range(x * scale, (x + 1) * scale):
+                    row[1 + (i >> 3)] |= 0x80 >> (i & 7)
+        rows.extend([bytes(row)] * scale)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    # 1 bit grayscale
+    header = struct.pack('>IIBBBBB', width * scale, height * scale, 1, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(b''.join(rows), 9)) + chunk(b'IEND', b''))
+
+
+def name(frame):
+    return hashlib.sha1(frame).hexdigest()[:12]
+
+
+def capture(days=2, overrides=None, seed=1):
+    """
+    Run main.py and collect the different screens it showed. Returns
+    {name: {'frame', 'first', 'count'}}
+    """
+    screens = {}
+
+    def on_frame(when, frame):
+        key = name(frame)
+        if key not in screens:
+            screens[key] = {'frame': frame, 'first': when, 'count': 0}
+        screens[key]['count'] += 1
+
+    glass = Glass(on_frame=on_frame)
+    simulation = harness.Simulation(days, overrides=overrides, seed=seed)
+    simulation.i2c_listener = glass.write
+    simulation.run()
+    glass.flush()
+    return screens
+
+
+def iso(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def save(screens, directory, scale=2):
+    """
+    Write each screen as screen-NAME.png and the index.json
+    """
+    os.makedirs(directory, exist_ok=True)
+    index = {}
+    for key, screen in sorted(screens.items(), key=lambda item: item[1]['first']):
+        with open(os.path.join(directory, 'screen-{}.png'.format(key)), 'wb') as f:
+            f.write(png(screen['frame'], 128, 64, scale))
+        index[key] = {'first': iso(screen['first']), 'count': screen['count']}
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def compare(screens, directory):
+    """
+    Screens that are new and screens that are gone, against a saved index
+    """
+    with open(os.path.join(directory, 'index.json')) as f:
+        saved = json.load(f)
+    return {'new': sorted(key for key in screens if key not in saved),
+            'gone': sorted(key for key in saved if key not in screens)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PNG pictures of the screens of main.py')
+    parser.add_argument('--days', type=float, default=2)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scale', type=int, default=2, help='pixels of the PNG per pixel of the display')
+    parser.add_argument('--save', metavar='DIR', help='write the screens and their index here')
+    parser.add_argument('--compare', metavar='DIR', help='check the screens against a saved index')
+    args = parser.parse_args(argv)
+    overrides = dict(setting.split('=', 1) for setting in args.set)
+    started = time.perf_counter()
+    screens = capture(args.days, overrides, args.seed)
+    result = {'screens': len(screens), 'frames': sum(screen['count'] for screen in screens.values()),
+              'seconds': round(time.perf_counter() - started, 3)}
+    if args.save:
+        save(screens, args.save, args.scale)
+        result['saved'] = args.save
+    if args.compare:
+        differences = compare(screens, args.compare)
+        result.update(differences)
+    print(json.dumps(result, indent=2))
+    if args.compare and (result['new'] or result['gone']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# Build the table of the altitude of the sun and the exposure of each day
+# that ephemeris.py reads in the esp32. Everything with floats and
+# trigonometry is done here, on the computer.
+#
+# The place, the schedules and the reference altitude are taken from
+# config.py. With several cameras the table has the times of the schedules of
+# all. The table has to be built again and copied to the esp32
+# (sim/deploy.py does both) when they change.
+#
+# The position of the sun is the low precision one of the Astronomical
+# Almanac, good to about 0.01 degrees. The light of the sun is the direct
+# light of a clear sky, that goes through more air when it is low (air mass
+# of Kasten and Young). The table has the factor of the exposure that gives
+# the same light as the sun at REFERENCE_ALTITUDE, not clipped, so the
+# esp32 multiplies the open time of each camera by it and clips it once
+# to EXPOSURE_MIN and EXPOSURE_MAX.
+#
+# Usage:
+#   python -m sim.suntable [--config config.py] [--output ephemeris.bin] [--show]
+
+import argparse
+import calendar
+import json
+import math
+import os
+import struct
+
+import sim
+sim.install()
+
+import ephemeris
+from sim import logreader
+
+# A leap year, so the table has the 29th of February
+YEAR = 2024
+SETTINGS = ('SCHEDULES', 'UTC_OFFSET', 'LATITUDE', 'LONGITUDE', 'REFERENCE_ALTITUDE')
+# For the exposures of PINHOLE_OPEN_TIME that main() prints
+EXPOSURE_SETTINGS = ('PINHOLE_OPEN_TIME', 'EXPOSURE_MIN', 'EXPOSURE_MAX')
+
+
+def sun_altitude(seconds, latitude, longitude):
+    """
+    Altitude of the sun in degrees at a time (UTC seconds) and place
+    """
+    # Days since 2000-01-01 12:00 UTC
+    n = seconds / 86400 - 10957.5
+    mean_longitude = (280.460 + 0.9856474 * n) % 360
+    anomaly = math.radians((357.528 + 0.9856003 * n) % 360)
+    ecliptic_longitude = math.radians(mean_longitude + 1.915 * math.sin(anomaly)
+                                      + 0.020 * math.sin(2 * anomaly))
+    obliquity = math.radians(23.439 - 0.0000004 * n)
+    right_ascension = math.atan2(math.cos(obliquity) * math.sin(ecliptic_longitude),
+                                 math.cos(ecliptic_longitude))
+    declination = math.asin(math.sin(obliquity) * math.sin(ecliptic_longitude))
+    sidereal_hours = (18.697374558 + 24.06570982441908 * n) % 24
+    hour_angle = math.radians(sidereal_hours * 15 + longitude) - right_ascension
+    lat = math.radians(latitude)
+    return math.degrees(math.asin(math.sin(lat) * math.sin(declination)
+                                  + math.cos(lat) * math.cos(declination) * math.cos(hour_angle)))
+
+
+def light(altitude):
+    """
+    Light of the sun with a clear sky at an altitude (degrees), relative to
+    the sun at the zenith without air. 0 below the horizon
+    """
+    if altitude <= 0:
+        return 0
+    air_mass = 1 / (math.sin(math.radians(altitude)) + 0.50572 * (altitude + 6.07995) ** -1.6364)
+    return math.sin(math.radians(altitude)) * 0.7 ** (air_mass ** 0.678)
+
+
+def factor(altitude, config):
+    """
+    How many times longer than with the sun at REFERENCE_ALTITUDE to open
+    with the sun at an altitude, in ephemeris.FACTOR_SCALE parts
+    """
+    now = light(altitude)
+    if not now:
+        return ephemeris.FACTOR_MAX
+    return min(round(ephemeris.FACTOR_SCALE * light(config['REFERENCE_ALTITUDE']) / now), ephemeris.FACTOR_MAX)
+
+
+def exposure(factor, open_time, config):
+    """
+    Seconds to open with a factor of the table, like program.py
+    """
+    seconds = (open_time * factor + ephemeris.FACTOR_SCALE // 2) // ephemeris.FACTOR_SCALE
+    return min(max(seconds, config['EXPOSURE_MIN']), config['EXPOSURE_MAX'])
+
+
+def times_of_day(schedules):
+    """
+    Seconds since midnight of all the openings of the schedules
+    """
+    return sorted({h * 3600 + m * 60 + s for schedule in schedules for h, m, s in schedule['times']})
+
+
+def rows(config):
+    """
+    (altitude in hundredths of degree, factor) of each day and time of the table
+    """
+    times = times_of_day([schedule for schedules in logreader.camera_schedules(config)
+                          for schedule in schedules])
+    start = calendar.timegm((YEAR, 1, 1, 0, 0, 0))
+    table = []
+    for day in range(ephemeris.DAYS):
+        for second in times:
+            local = start + day * 86400 + second
+            altitude = sun_altitude(local - config['UTC_OFFSET'], config['LATITUDE'], config['LONGITUDE'])
+            table.append((round(altitude * 100), factor(altitude, config)))
+    return times, table
+
+
+def build(config):
+    """
+    The table as bytes, in the format of ephemeris.py
+    """
+    times, table = rows(config)
+    data = bytearray(struct.pack(ephemeris.HEADER, ephemeris.MAGIC, len(times)))
+    data += struct.pack('<{}I'.format(len(times)), *times)
+    for record in table:
+        data += struct.pack(ephemeris.RECORD, *record)
+    return bytes(data)
+
+
+def write(path, settings=os.path.join(sim.REPO_DIR, 'config.py')):
+    """
+    Build the table with the settings of config.py and write it to path
+    """
+    config = logreader.values(settings, SETTINGS + EXPOSURE_SETTINGS + ('CAMERAS',))
+    missing = [name for name in SETTINGS if name not in config]
+    if missing:
+        raise ValueError('config.py has no setting {}'.format(', '.join(missing)))
+    with open(path, 'wb') as f:
+        f.write(build(config))
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the table of the sun for ephemeris.py')
+    parser.add_argument('--config', default=os.path.join(sim.REPO_DIR, 'config.py'))
+    parser.add_argument('--output', default=ephemeris.FILE)
+    parser.add_argument('--show', action='store_true', help='print the altitude and exposure of each week')
+    args = parser.parse_args(argv)
+    config = write(args.output, args.config)
+    times, table = rows(config)
+    altitudes = [altitude / 100 for altitude, _ in table]
+    exposures = [exposure(factor, config['PINHOLE_OPEN_TIME'], config) for _, factor in table]
+    result = {'file': args.output, 'bytes': os.path.getsize(args.output), 'times': times,
+              'altitude': {'min': min(altitudes), 'max': max(altitudes)},
+              'exposure': {'min': min(exposures), 'max': max(exposures)}}
+    if args.show:
+        result['weeks'] = [
+            {'day': day + 1, 'altitude': table[day * len(times)][0] / 100, 'exposure': exposures[day * len(times)]}
+            for day in range(0, ephemeris.DAYS, 7)]
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# Stand-in for uasyncio, running the tasks on the virtual clock of the
+# simulated world. When all the tasks wait, the clock jumps straight to the
+# next one that has to run, so hours of the program take no time.
+
+import heapq
+
+from sim import world as _world
+
+
+class _Sleep:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __await__(self):
+        yield self
+
+
+class _Wait:
+    def __init__(self, event):
+        self.event = event
+
+    def __await__(self):
+        yield self
+
+
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        self.result = None
+
+    def cancel(self):
+        self.done = True
+
+
+class Event:
+    def __init__(self):
+        self.state = False
+        self.waiting = []
+
+    def set(self):
+        self.state = True
+        for task in self.waiting:
+            _schedule(task, 0)
+        self.waiting = []
+
+    def clear(self):
+        self.state = False
+
+    def is_set(self):
+        return self.state
+
+    async def wait(self):
+        if not self.state:
+            await _Wait(self)
+        return True
+
+
+class ThreadSafeFlag:
+    """
+    An event that can be set from an interrupt, and clears itself when a
+    task waited for it
+    """
+    def __init__(self):
+        self.event = Event()
+
+    def set(self):
+        self.event.set()
+
+    def clear(self):
+        self.event.clear()
+
+    async def wait(self):
+        await self.event.wait()
+        self.event.clear()
+
+
+# (time, order, task) of the tasks ready to run
+_queue = []
+_order = 0
+
+
+def _schedule(task, delay):
+    global _order
+    _order += 1
+    heapq.heappush(_queue, (_world.world.now + delay, _order, task))
+
+
+async def sleep(seconds):
+    await _Sleep(seconds)
+
+
+async def sleep_ms(ms):
+    await _Sleep(ms / 1000)
+
+
+def create_task(coro):
+    task = Task(coro)
+    _schedule(task, 0)
+    return task
+
+
+class Loop:
+    def __init__(self):
+        self.handler = None
+
+    def set_exception_handler(self, handler):
+        self.handler = handler
+
+    def call_exception_handler(self, context):
+        if self.handler:
+            self.handler(self, context)
+        else:
+            print('Task exception wasn\'t retrieved')
+            print(repr(context['exception']))
+
+
+_loop = Loop()
+
+
+def run(coro):
+    """
+    Run the tasks until coro ends. An exception of coro ends it, the ones of
+    the other tasks go to the exception handler of the loop, like uasyncio
+    """
+    del _queue[:]
+    _loop.handler = None
+    main = create_task(coro)
+    world = _world.world
+    while not main.done:
+        if not _queue:
+            raise RuntimeError('all the tasks are waiting for events')
+        when, order, task = heapq.heappop(_queue)
+        if task.done:
+            continue
+        timer = world.next_timer()
+        if timer is not None and timer < when:
+            # Stop at the timer, its callback may make a task ready before this one
+            heapq.heappush(_queue, (when, order, task))
+            world.advance(timer - world.now)
+            continue
+        world.advance(when - world.now)
+        try:
+            request = task.coro.send(None)
+        except StopIteration as e:
+            task.done = True
+            task.result = e.value
+            continue
+        except Exception as e:
+            task.done = True
+            if task is main:
+                raise
+            _loop.call_exception_handler({'message': 'Task exception wasn\'t retrieved',
+                                          'exception': e, 'future': task})
+            continue
+        if isinstance(request, _Sleep):
+            _schedule(task, max(request.seconds, 0))
+        elif isinstance(request, _Wait):
+            request.event.waiting.append(task)
+    return main.result
+
+
+def get_event_loop():
+    return _loop
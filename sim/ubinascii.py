@@ -0,0 +1,2 @@
+# Stand-in for the MicroPython ubinascii module
+from binascii import *
@@ -0,0 +1,8 @@
+# Stand-in for umqtt.robust. Same as umqtt.simple in the simulation.
+
+from sim.umqtt.simple import MQTTClient as _SimpleClient
+from sim.umqtt.simple import MQTTException
+
+
+class MQTTClient(_SimpleClient):
+    pass
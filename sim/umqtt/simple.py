@@ -0,0 +1,65 @@
+# Stand-in for umqtt.simple, talking to the broker of the simulated world.
+# Every message published is kept in world.publishes.
+
+from sim import world as _world
+
+# Seconds that the broker takes to answer
+CONNECT_TIME = 0.3
+PUBLISH_TIME = 0.02
+
+
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=False, ssl_params={}):
+        self.client_id = client_id
+        self.server = server
+        self.keepalive = keepalive
+        self.connected = False
+
+    def _check(self):
+        from sim import network
+        world = _world.world
+        if not network.WLAN(network.STA_IF).isconnected() or not world.online():
+            self.connected = False
+            raise OSError(113)
+
+    def connect(self, clean_session=True):
+        world = _world.world
+        world.mqtt_connects += 1
+        self._check()
+        world.advance(CONNECT_TIME)
+        self.connected = True
+        return False
+
+    def disconnect(self):
+        self.connected = False
+
+    def ping(self):
+        if not self.connected:
+            raise OSError(128)
+        self._check()
+        _world.world.advance(PUBLISH_TIME)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        if not self.connected:
+            raise OSError(128)
+        self._check()
+        world = _world.world
+        world.advance(PUBLISH_TIME)
+        world.publishes.append((world.now, bytes(topic), bytes(msg)))
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def check_msg(self):
+        return None
+
+    def wait_msg(self):
+        return None
@@ -0,0 +1,71 @@
+# Stand-in for the time module of MicroPython, on the virtual clock of the
+# simulated world. Sleeping moves the clock forward instead of waiting.
+# It is installed as the time module only while the program runs; anything
+# not defined here comes from the time module of Python.
+# time() counts from the epoch of the world, 1970-01-01 unless the harness
+# runs it as the esp32, from 2000-01-01.
+
+import calendar
+import time as _time
+
+from sim import world as _world
+
+
+def __getattr__(name):
+    return getattr(_time, name)
+
+
+def time():
+    return int(_world.world.device_time()) - _world.world.epoch
+
+
+def time_ns():
+    return int((_world.world.device_time() - _world.world.epoch) * 1000000000)
+
+
+def gmtime(secs=None):
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(secs + _world.world.epoch)
+    # MicroPython gives 8 values, without the daylight saving flag
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+# The esp32 has no timezone, localtime is UTC
+localtime = gmtime
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0)) - _world.world.epoch
+
+
+def sleep(seconds):
+    _world.world.advance(seconds)
+
+
+def sleep_ms(ms):
+    _world.world.advance(ms / 1000)
+
+
+def sleep_us(us):
+    _world.world.advance(us / 1000000)
+
+
+def ticks_ms():
+    return int(_world.world.now * 1000)
+
+
+def ticks_us():
+    return int(_world.world.now * 1000000)
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(new, old):
+    return new - old
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
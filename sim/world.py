@@ -0,0 +1,244 @@
+# The simulated world around the esp32: a virtual clock, the RTC, the WiFi
+# access point, the mqtt broker and the NTP servers. The stand-in modules
+# (machine, network, ntptime, umqtt, uasyncio and the time module) all work
+# on the current world, so everything the program does is counted here.
+
+import math
+import random
+
+
+class SimulationEnd(BaseException):
+    """
+    The virtual clock reached the end of the simulation.
+    A BaseException, so the `except Exception` of the program do not catch it
+    """
+
+
+class DeepSleep(BaseException):
+    """
+    The program called machine.deepsleep(). Like on the esp32, the program
+    does not continue after it, it starts again from main.py
+    """
+    def __init__(self, ms):
+        super().__init__(ms)
+        self.ms = ms
+
+
+class Reset(BaseException):
+    """
+    The esp32 was reset: machine.reset(), the watchdog or a fault of the
+    simulation. The program starts again from main.py, the RTC memory stays
+    """
+    def __init__(self, cause):
+        super().__init__(cause)
+        self.cause = cause
+
+
+class Fault(Exception):
+    """
+    An error the simulation raises in the middle of the program, like a
+    failing sensor or bus
+    """
+
+
+class World:
+    def __init__(self, start, end, rtc_drift_ppm=0, outages=(), seed=1,
+                 ssid='estenopeica', password='secret', faults=(), epoch=0):
+        # True time, in seconds since the epoch (UTC)
+        self.now = float(start)
+        # Epoch of time.time() in the program, in seconds since 1970-01-01.
+        # The esp32 counts from 2000-01-01 (946684800)
+        self.epoch = epoch
+        self.start = float(start)
+        self.end = float(end)
+        # The RTC starts at the epoch of the esp32 (2000-01-01) after a power
+        # on, and runs rtc_drift_ppm slow
+        self.rtc_value = 946684800.0
+        self.rtc_set_at = self.now
+        self.rtc_drift = rtc_drift_ppm / 1000000
+        self.rtc_memory = b''
+        self.reset_cause = 1
+        # Access point, broker and NTP are down in the outages, (start, end)
+        self.outages = tuple(outages)
+        self.ssid = ssid
+        self.password = password
+        self.bssid = b'\x24\x0a\xc4\x11\x22\x33'
+        self.channel = 6
+        self.random = random.Random(seed)
+        # Per wake up state: WLAN interfaces. Cleared when sleeping
+        self.interfaces = {}
+        self.awake = True
+        self.radio_on = False
+        # Counters
+        self.awake_time = 0.0
+        self.radio_time = 0.0
+        self.servo_time = 0.0
+        self.sleep_time = 0.0
+        self.wakes = 0
+        self.i2c_transactions = 0
+        self.i2c_bytes = 0
+        # Optional callable(addr, data) that gets every I2C write, of any bus
+        self.i2c_listener = None
+        self.spi_transactions = 0
+        self.spi_bytes = 0
+        self.publishes = []
+        self.mqtt_connects = 0
+        self.ntp_queries = 0
+        self.wifi_connects = 0
+        self.wifi_scans = 0
+        # Timers running, timer: (time it fires, period or None if one shot)
+        self.timers = {}
+        # Watchdog: (timeout, time it resets) or None if not started
+        self.watchdog = None
+        self.resets = 0
+        # (time, kind) of the faults to cause, kind is 'error' or 'reset'
+        self.faults = sorted(faults)
+        # Servo pulse (us) per pin, and (time, pin, 'open'/'close') moves
+        self.servo_threshold_us = 900
+        self.servo_pulses = {}
+        self.servo_moves = []
+
+    def advance(self, seconds):
+        """
+        Move the virtual clock forward, firing the timers on the way
+        """
+        target = self.now + max(seconds, 0)
+        while self.timers:
+            timer = min(self.timers, key=lambda t: self.timers[t][0])
+            when, period = self.timers[timer]
+            if when > target:
+                break
+            self.move(when - self.now)
+            if period is None:
+                del self.timers[timer]
+            else:
+                self.timers[timer] = (when + period, period)
+            timer.fire()
+        self.move(target - self.now)
+
+    def next_timer(self):
+        """
+        Time when the next timer fires. None if there are no timers
+        """
+        if not self.timers:
+            return None
+        return min(when for when, _ in self.timers.values())
+
+    def move(self, seconds):
+        """
+        Move the virtual clock forward, without looking at the timers
+        """
+        if seconds <= 0:
+            return
+        if self.now + seconds >= self.end:
+            seconds = self.end - self.now
+            self.account(seconds)
+            self.now = self.end
+            raise SimulationEnd()
+        if self.watchdog and self.now + seconds >= self.watchdog[1]:
+            # Nobody fed it
+            self.account(self.watchdog[1] - self.now)
+            self.now = self.watchdog[1]
+            raise Reset(3)
+        self.account(seconds)
+        self.now += seconds
+        if self.awake and self.faults and self.now >= self.faults[0][0]:
+            kind = self.faults.pop(0)[1]
+            if kind == 'reset':
+                raise Reset(3)
+            raise Fault('simulated fault')
+
+    def account(self, seconds):
+        """
+        Add time to the awake, radio and sleep counters
+        """
+        if self.awake:
+            self.awake_time += seconds
+            if self.radio_on:
+                self.radio_time += seconds
+            if any(self.servo_pulses.values()):
+                self.servo_time += seconds
+        else:
+            self.sleep_time += seconds
+
+    def online(self):
+        """
+        Check if the access point, broker and NTP servers work now
+        """
+        for start, end in self.outages:
+            if start <= self.now < end:
+                return False
+        return True
+
+    def device_time(self):
+        """
+        The time of the RTC, in seconds since the epoch
+        """
+        return self.rtc_value + (self.now - self.rtc_set_at) * (1 - self.rtc_drift)
+
+    def set_device_time(self, seconds):
+        self.rtc_value = float(seconds)
+        self.rtc_set_at = self.now
+
+    def humidity(self):
+        """
+        Reading of the humidity sensor: a daily cycle plus noise
+        """
+        day = (self.now % 86400) / 86400
+        return max(0, min(4095, int(1800 + 300 * math.sin(2 * math.pi * day) + self.random.gauss(0, 40))))
+
+    def servo_pulse(self, pin, pulse_us):
+        """
+        The PWM of a pin changed. None means no pulse, the servo stays where it is
+        """
+        self.servo_pulses[pin] = pulse_us
+        if pulse_us is None or pulse_us == 0:
+            return
+        position = 'open' if pulse_us > self.servo_threshold_us else 'close'
+        last = [move for move in self.servo_moves if move[1] == pin]
+        if not last or last[-1][2] != position:
+            self.servo_moves.append((self.now, pin, position))
+
+    def feed_watchdog(self, timeout=None):
+        """
+        Start the watchdog, or feed it
+        """
+        if timeout is None:
+            timeout = self.watchdog[0]
+        self.watchdog = (timeout, self.now + timeout)
+
+    def stop(self):
+        """
+        The RAM, the WiFi, the timers and the PWM are lost, the RTC keeps going
+        """
+        self.radio_on = False
+        self.interfaces = {}
+        self.timers = {}
+        self.watchdog = None
+        # The servo stays where it is
+        self.servo_pulses = {}
+
+    def reset(self, cause):
+        """
+        The esp32 was reset, it starts again straight away
+        """
+        self.stop()
+        self.reset_cause = cause
+        self.resets += 1
+
+    def deep_sleep(self, ms):
+        """
+        Sleep: the RAM and the WiFi are lost, the RTC keeps going
+        """
+        self.stop()
+        self.awake = False
+        try:
+            self.advance(ms / 1000)
+        finally:
+            self.awake = True
+        self.reset_cause = 4
+        self.wakes += 1
+
+
+# The world the stand-in modules work on
+world = None
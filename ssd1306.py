@@ -22,6 +22,9 @@ SET_PRECHARGE       = const(0xd9)
 SET_VCOM_DESEL      = const(0xdb)
 SET_CHARGE_PUMP     = const(0x8d)
 
+# Commands that fit in one batched write, enough for the whole init sequence
+CMD_BUF_LEN         = const(32)
+
 
 class SSD1306:
     def __init__(self, width, height, external_vcc):
@@ -29,14 +32,24 @@ class SSD1306:
         self.height = height
         self.external_vcc = external_vcc
         self.pages = self.height // 8
+        # Dirty window per page, as first/last column changed since the last
+        # show(). A first column of 0xff marks a clean page.
+        self.dirty_x0 = bytearray(b'\xff' * self.pages)
+        self.dirty_x1 = bytearray(self.pages)
+        # Copy of what is on the glass, to send only the bytes that changed.
+        # Not valid until the first full show().
+        self.shadow = bytearray(self.pages * self.width)
+        self.synced = False
         # Note the subclass must initialize self.framebuf to a framebuffer.
         # This is necessary because the underlying data buffer is different
         # between I2C and SPI implementations (I2C needs an extra byte).
+        # The same goes for self.cmds, the CMD_BUF_LEN bytes where commands
+        # are queued before write_cmds() sends them in a single write.
         self.poweron()
         self.init_display()
 
     def init_display(self):
-        for cmd in (
+        self.send_cmds((
             SET_DISP | 0x00, # off
             # address setting
             SET_MEM_ADDR, 0x00, # horizontal
@@ -57,47 +70,132 @@ class SSD1306:
             SET_NORM_INV, # not inverted
             # charge pump
             SET_CHARGE_PUMP, 0x10 if self.external_vcc else 0x14,
-            SET_DISP | 0x01): # on
-            self.write_cmd(cmd)
+            SET_DISP | 0x01)) # on
         self.fill(0)
+        self.invalidate()
         self.show()
 
     def poweroff(self):
         self.write_cmd(SET_DISP | 0x00)
 
+    def send_cmds(self, cmds):
+        # Queue a sequence of commands and send them in as few writes as the
+        # command buffer allows
+        n = 0
+        for cmd in cmds:
+            if n == CMD_BUF_LEN:
+                self.write_cmds(n)
+                n = 0
+            self.cmds[n] = cmd
+            n += 1
+        if n:
+            self.write_cmds(n)
+
     def contrast(self, contrast):
-        self.write_cmd(SET_CONTRAST)
-        self.write_cmd(contrast)
+        self.cmds[0] = SET_CONTRAST
+        self.cmds[1] = contrast
+        self.write_cmds(2)
 
     def invert(self, invert):
-        self.write_cmd(SET_NORM_INV | (invert & 1))
+        self.cmds[0] = SET_NORM_INV | (invert & 1)
+        self.write_cmds(1)
 
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
+    def set_window(self, x0, x1, p0, p1):
         if self.width == 64:
             # displays with width of 64 pixels are shifted by 32
             x0 += 32
             x1 += 32
-        self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_framebuf()
+        cmds = self.cmds
+        cmds[0] = SET_COL_ADDR
+        cmds[1] = x0
+        cmds[2] = x1
+        cmds[3] = SET_PAGE_ADDR
+        cmds[4] = p0
+        cmds[5] = p1
+        self.write_cmds(6)
+
+    def mark_dirty(self, x0, y0, x1, y1):
+        # Mark the rectangle (inclusive) as changed, clipped to the screen
+        if x1 < 0 or y1 < 0 or x0 >= self.width or y0 >= self.height:
+            return
+        x0 = max(x0, 0)
+        x1 = min(x1, self.width - 1)
+        for page in range(max(y0, 0) // 8, min(y1, self.height - 1) // 8 + 1):
+            if self.dirty_x0[page] == 0xff or x0 < self.dirty_x0[page]:
+                self.dirty_x0[page] = x0
+            if x1 > self.dirty_x1[page]:
+                self.dirty_x1[page] = x1
+
+    def invalidate(self):
+        # Forget what is on the glass, so next show() sends the full frame
+        self.synced = False
+        self.mark_dirty(0, 0, self.width - 1, self.height - 1)
+
+    def narrow(self, page):
+        # Shrink the dirty window of a page to the columns that really differ
+        # from the glass. Returns False if nothing changed in the page.
+        base = page * self.width
+        buf = self.framebuf_data
+        shadow = self.shadow
+        x0 = self.dirty_x0[page]
+        x1 = self.dirty_x1[page]
+        while x0 <= x1 and buf[base + x0] == shadow[base + x0]:
+            x0 += 1
+        while x1 > x0 and buf[base + x1] == shadow[base + x1]:
+            x1 -= 1
+        self.dirty_x0[page] = x0
+        self.dirty_x1[page] = x1
+        return x0 <= x1
+
+    def show(self):
+        # Send only the pages, and the columns inside them, that changed since
+        # the last show(). Returns the number of data bytes sent.
+        sent = 0
+        page = 0
+        while page < self.pages:
+            if self.dirty_x0[page] == 0xff or (self.synced and not self.narrow(page)):
+                self.dirty_x0[page] = 0xff
+                self.dirty_x1[page] = 0
+                page += 1
+                continue
+            # Consecutive pages changed across the full width are contiguous
+            # in the buffer and go out as a single block
+            last = page
+            if self.dirty_x0[page] == 0 and self.dirty_x1[page] == self.width - 1:
+                while (last + 1 < self.pages and self.dirty_x0[last + 1] == 0
+                       and self.dirty_x1[last + 1] == self.width - 1):
+                    last += 1
+            x0 = self.dirty_x0[page]
+            x1 = self.dirty_x1[page]
+            self.set_window(x0, x1, page, last)
+            start = page * self.width + x0
+            end = last * self.width + x1 + 1
+            self.write_data(start, end)
+            self.shadow[start:end] = self.framebuf_data[start:end]
+            sent += end - start
+            for p in range(page, last + 1):
+                self.dirty_x0[p] = 0xff
+                self.dirty_x1[p] = 0
+            page = last + 1
+        self.synced = True
+        return sent
 
     def fill(self, col):
         self.framebuf.fill(col)
+        self.mark_dirty(0, 0, self.width - 1, self.height - 1)
 
     def pixel(self, x, y, col):
         self.framebuf.pixel(x, y, col)
+        self.mark_dirty(x, y, x, y)
 
     def scroll(self, dx, dy):
         self.framebuf.scroll(dx, dy)
+        self.mark_dirty(0, 0, self.width - 1, self.height - 1)
 
     def text(self, string, x, y, col=1):
         self.framebuf.text(string, x, y, col)
+        # The built-in font is 8x8 pixels per character
+        self.mark_dirty(x, y, x + 8 * len(string) - 1, y + 7)
 
 
 class SSD1306_I2C(SSD1306):
@@ -105,6 +203,14 @@ class SSD1306_I2C(SSD1306):
         self.i2c = i2c
         self.addr = addr
         self.temp = bytearray(2)
+        # Batched commands go after a Co=0, D/C#=0 control byte, which makes
+        # the controller read every following byte as a command
+        self.cmd_buf = bytearray(CMD_BUF_LEN + 1)
+        self.cmd_buf[0] = 0x00
+        self.cmds = memoryview(self.cmd_buf)[1:]
+        # Views of the control byte plus the first n commands, made once so
+        # sending commands does not allocate
+        self.cmd_views = tuple(memoryview(self.cmd_buf)[:n + 1] for n in range(CMD_BUF_LEN + 1))
         # Add an extra byte to the data buffer to hold an I2C data/command byte
         # to use hardware-compatible I2C transactions.  A memoryview of the
         # buffer is used to mask this byte from the framebuffer operations
@@ -112,7 +218,10 @@ class SSD1306_I2C(SSD1306):
         # buffer).
         self.buffer = bytearray(((height // 8) * width) + 1)
         self.buffer[0] = 0x40  # Set first byte of data buffer to Co=0, D/C=1
-        self.framebuf = framebuf.FrameBuffer1(memoryview(self.buffer)[1:], width, height)
+        # One view of the whole buffer, made once, that write_data() slices
+        self.buffer_view = memoryview(self.buffer)
+        self.framebuf_data = self.buffer_view[1:]
+        self.framebuf = framebuf.FrameBuffer1(self.framebuf_data, width, height)
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -120,11 +229,27 @@ class SSD1306_I2C(SSD1306):
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
 
+    def write_cmds(self, n):
+        # Send the first n queued commands in a single I2C transaction
+        self.i2c.writeto(self.addr, self.cmd_views[n])
+
     def write_framebuf(self):
         # Blast out the frame buffer using a single I2C transaction to support
         # hardware I2C interfaces.
         self.i2c.writeto(self.addr, self.buffer)
 
+    def write_data(self, start, end):
+        # Send framebuffer bytes [start, end) in one I2C transaction. The byte
+        # just before the slice in self.buffer is borrowed to hold the Co=0,
+        # D/C=1 control byte and restored afterwards, so no copy is made.
+        if start == 0 and end == len(self.buffer) - 1:
+            self.i2c.writeto(self.addr, self.buffer)
+            return
+        saved = self.buffer[start]
+        self.buffer[start] = 0x40
+        self.i2c.writeto(self.addr, self.buffer_view[start:end + 1])
+        self.buffer[start] = saved
+
     def poweron(self):
         pass
 
@@ -140,25 +265,49 @@ class SSD1306_SPI(SSD1306):
         self.res = res
         self.cs = cs
         self.buffer = bytearray((height // 8) * width)
+        self.cmd_buf = bytearray(CMD_BUF_LEN)
+        self.cmds = self.cmd_buf
+        # Views of the first n commands, made once so sending commands does
+        # not allocate
+        self.cmd_views = tuple(memoryview(self.cmd_buf)[:n] for n in range(CMD_BUF_LEN + 1))
+        # The bus is configured once here and assumed to be dedicated to the
+        # display, instead of being re-initialised before every write
+        spi.init(baudrate=self.rate, polarity=0, phase=0)
+        # One view of the buffer, made once, that write_data() slices
+        self.buffer_view = memoryview(self.buffer)
+        self.framebuf_data = self.buffer
         self.framebuf = framebuf.FrameBuffer1(self.buffer, width, height)
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.cmd_buf[0] = cmd
+        self.write_cmds(1)
+
+    def write_cmds(self, n):
+        # Send the first n queued commands with a single chip select
         self.cs.high()
         self.dc.low()
         self.cs.low()
-        self.spi.write(bytearray([cmd]))
+        self.spi.write(self.cmd_views[n])
         self.cs.high()
 
     def write_framebuf(self):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
         self.cs.high()
         self.dc.high()
         self.cs.low()
         self.spi.write(self.buffer)
         self.cs.high()
 
+    def write_data(self, start, end):
+        if start == 0 and end == len(self.buffer):
+            self.write_framebuf()
+            return
+        self.cs.high()
+        self.dc.high()
+        self.cs.low()
+        self.spi.write(self.buffer_view[start:end])
+        self.cs.high()
+
     def poweron(self):
         self.res.high()
         time.sleep_ms(1)
@@ -0,0 +1,263 @@
+# Estenopeica-control
+# Buffered telemetry for Adafruit IO.
+#
+# The samples are kept with their time in a fixed size ring buffer, and sent
+# in batches: all the samples taken at the same time go in one message to an
+# Adafruit IO group, so one message carries several feeds. A message has
+# each feed once, a feed sampled again at the same time starts the next
+# message, so no sample is lost. If the broker can
+# not be reached the samples stay in the buffer for the next flush, and are
+# saved in the flash before deep sleep so they survive it.
+# When the buffer is full the oldest samples are dropped. Feeds that are only
+# diagnostics can keep just their latest sample, so a long outage fills the
+# buffer with the measures and not with them.
+#
+# The ring is made of preallocated lists and the messages are written in a
+# reusable buffer, with the feed names encoded once and the numbers written
+# digit by digit, so sending the telemetry allocates almost nothing and does
+# not fragment the heap in a long run.
+
+import json
+import os
+import time
+
+# Number of samples kept. Three days without network of hourly reports (two
+# samples each) and a daily opening (five), plus the latest diagnostics
+RING_SIZE = 192
+# File in the flash where the unsent samples are kept while sleeping
+RING_FILE = 'telemetry.json'
+# Size of the buffer of a message. Samples that do not fit go in the next one
+PAYLOAD_SIZE = 1024
+# What closes a message: '}, "created_at": "2025-01-01T00:00:00Z"}'
+PAYLOAD_TAIL = 40
+
+
+class Telemetry:
+    def __init__(self, username, group=b'default', size=RING_SIZE, path=RING_FILE, latest=()):
+        # Feeds are published as part of the group
+        self.topic = username + b'/groups/' + group
+        self.size = size
+        self.path = path
+        # Feeds of which only the last sample not sent is kept
+        self.latest = latest
+        # Ring of samples: time, feed and value. head is the oldest sample
+        self.times = [0] * size
+        self.feeds = [None] * size
+        self.values = [None] * size
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.sent = 0
+        self.messages = 0
+        # Buffer where the messages are written
+        self.payload = bytearray(PAYLOAD_SIZE)
+        self.view = memoryview(self.payload)
+        # '"feed": ' encoded, by feed
+        self.keys = {}
+
+    def add(self, feed, value, when=None):
+        """
+        Keep a sample of a feed. when is in seconds (UTC), now if not given
+        """
+        if when is None:
+            when = time.time()
+        if feed in self.latest:
+            self.forget(feed)
+        if self.count == self.size:
+            # Full, forget the oldest
+            self.head = (self.head + 1) % self.size
+            self.count -= 1
+            self.dropped += 1
+        i = (self.head + self.count) % self.size
+        self.times[i] = when
+        self.feeds[i] = feed
+        self.values[i] = value
+        self.count += 1
+
+    def forget(self, feed):
+        """
+        Remove the first sample of a feed, if there is one. The samples after
+        it move back one place, so the ring stays in order
+        """
+        n = 0
+        while n < self.count and self.feeds[(self.head + n) % self.size] != feed:
+            n += 1
+        if n == self.count:
+            return
+        while n < self.count - 1:
+            i = (self.head + n) % self.size
+            j = (i + 1) % self.size
+            self.times[i] = self.times[j]
+            self.feeds[i] = self.feeds[j]
+            self.values[i] = self.values[j]
+            n += 1
+        i = (self.head + n) % self.size
+        self.feeds[i] = None
+        self.values[i] = None
+        self.count -= 1
+
+    def key(self, feed):
+        """
+        The feed as a key of the message, encoded only the first time
+        """
+        key = self.keys.get(feed)
+        if key is None:
+            key = self.keys[feed] = ('"' + feed + '": ').encode()
+        return key
+
+    def put(self, n, data):
+        """
+        Write bytes in the payload at n. Returns where they end
+        """
+        payload = self.payload
+        for i in range(len(data)):
+            payload[n + i] = data[i]
+        return n + len(data)
+
+    def put_int(self, n, value, width=1):
+        """
+        Write an integer in the payload at n, with at least width digits
+        """
+        payload = self.payload
+        if value < 0:
+            payload[n] = 45  # -
+            n += 1
+            value = -value
+        start = n
+        while value or n - start < width:
+            payload[n] = 48 + value % 10
+            value //= 10
+            n += 1
+        # The digits were written from the last one
+        i = start
+        j = n - 1
+        while i < j:
+            payload[i], payload[j] = payload[j], payload[i]
+            i += 1
+            j -= 1
+        return n
+
+    def put_value(self, n, value):
+        """
+        Write a value of a feed in the payload at n, as json
+        """
+        if isinstance(value, int):
+            return self.put_int(n, value)
+        if isinstance(value, str):
+            payload = self.payload
+            payload[n] = 34  # "
+            n += 1
+            for char in value:
+                if char == '"' or char == '\\':
+                    payload[n] = 92  # backslash
+                    n += 1
+                payload[n] = ord(char) if ord(char) < 128 else 63
+                n += 1
+            payload[n] = 34
+            return n + 1
+        return self.put(n, json.dumps(value).encode())
+
+    def value_size(self, value):
+        """
+        Most bytes that a value takes in the payload
+        """
+        if isinstance(value, int):
+            return 20
+        if isinstance(value, str):
+            return 2 * len(value) + 2
+        return len(json.dumps(value))
+
+    def in_batch(self, feed, end):
+        """
+        Check if one of the first end samples after head is of the feed
+        """
+        for sample in range(end):
+            if self.feeds[(self.head + sample) % self.size] == feed:
+                return True
+        return False
+
+    def batch(self):
+        """
+        Get the oldest samples taken at the same time, each feed once, as
+        (number, payload). The payload is a view of the buffer, valid until
+        the next batch
+        """
+        when = self.times[self.head]
+        # Samples of the batch, as many as fit
+        end = 0
+        space = PAYLOAD_SIZE - PAYLOAD_TAIL - 11
+        while end < self.count:
+            i = (self.head + end) % self.size
+            if self.times[i] != when or self.in_batch(self.feeds[i], end):
+                break
+            space -= len(self.key(self.feeds[i])) + self.value_size(self.values[i]) + 2
+            if space < 0 and end:
+                break
+            end += 1
+        n = self.put(0, b'{"feeds": {')
+        first = True
+        for sample in range(end):
+            i = (self.head + sample) % self.size
+            if not first:
+                n = self.put(n, b', ')
+            first = False
+            n = self.put(n, self.key(self.feeds[i]))
+            n = self.put_value(n, self.values[i])
+        t = time.gmtime(when)
+        n = self.put(n, b'}, "created_at": "')
+        n = self.put_int(n, t[0], 4)
+        for separator, field in ((45, 1), (45, 2), (84, 3), (58, 4), (58, 5)):
+            self.payload[n] = separator
+            n = self.put_int(n + 1, t[field], 2)
+        n = self.put(n, b'Z"}')
+        return end, self.view[:n]
+
+    def flush(self, client):
+        """
+        Send all the samples. Returns False if the broker could not be reached,
+        the samples not sent stay in the buffer
+        """
+        while self.count:
+            n, payload = self.batch()
+            try:
+                client.publish(self.topic, payload, qos=0)
+            except OSError as e:
+                print('Could not publish the telemetry {}{}'.format(type(e).__name__, e))
+                return False
+            for sample in range(n):
+                # Let the values be collected
+                self.values[(self.head + sample) % self.size] = None
+            self.head = (self.head + n) % self.size
+            self.count -= n
+            self.sent += n
+            self.messages += 1
+        return True
+
+    def save(self):
+        """
+        Save the samples not sent in the flash. Nothing is written if all were sent
+        """
+        if not self.count:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return
+        samples = []
+        for n in range(self.count):
+            i = (self.head + n) % self.size
+            samples.append([self.times[i], self.feeds[i], self.values[i]])
+        with open(self.path, 'w') as f:
+            json.dump(samples, f)
+
+    def load(self):
+        """
+        Get back the samples saved in the flash
+        """
+        try:
+            with open(self.path) as f:
+                samples = json.load(f)
+        except (OSError, ValueError):
+            return
+        for when, feed, value in samples:
+            self.add(feed, value, when)
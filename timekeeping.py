@@ -0,0 +1,147 @@
+# Estenopeica-control
+# Keep the time of the RTC right with as few NTP queries as possible.
+#
+# Each NTP sync measures how much the RTC drifted since the previous one, and
+# from that its drift rate. Between syncs the RTC is corrected with that
+# rate, also when the network is down. A new sync is only done when the
+# estimated error of the corrected RTC could be more than MAX_ERROR.
+#
+# The drift information is kept in the 'clock' entry of the state of the
+# program (see rtcstate.py), so it survives deep sleep.
+
+import time
+import machine
+
+# NTP servers, tried in order until one answers
+NTP_SERVERS = ('pool.ntp.org', 'time.google.com', 'time.cloudflare.com')
+# Seconds to wait for each server
+NTP_TIMEOUT = 1
+# Sync again when the time could be wrong by more than this many seconds
+MAX_ERROR = 2
+# How wrong the drift rate could be, in parts per million. Before the drift
+# is measured, and after, as a fraction of it. It is also never better than
+# one second (the resolution of NTP and the RTC) in the time it was measured.
+UNKNOWN_DRIFT_PPM = 1000
+DRIFT_UNCERTAINTY = 0.1
+MIN_DRIFT_PPM = 5
+# The drift is averaged over at most this many seconds of measures, so it
+# can follow slow changes like the seasons
+MAX_DRIFT_SPAN = 30 * 24 * 3600
+# Sync at least this often (seconds), whatever the estimation says
+MAX_SYNC_PERIOD = 7 * 24 * 3600
+# Correct the RTC when the accumulated drift is more than this many seconds
+MIN_CORRECTION = 1
+
+
+def set_rtc(seconds):
+    """
+    Set the RTC to a time in seconds (UTC)
+    """
+    tm = time.gmtime(seconds)
+    machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], 0))
+
+
+def shift_rtc(seconds):
+    """
+    Move the RTC by a number of whole seconds, keeping the fraction of second
+    """
+    rtc = machine.RTC()
+    dt = rtc.datetime()
+    tm = time.gmtime(time.mktime((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6], 0, 0)) + seconds)
+    rtc.datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], dt[7]))
+
+
+def uncertainty_ppm(clock):
+    """
+    How wrong the corrected RTC could be, in parts per million
+    """
+    if clock.get('drift') is None:
+        return UNKNOWN_DRIFT_PPM
+    return max(abs(clock['drift']) * DRIFT_UNCERTAINTY, MIN_DRIFT_PPM, 1000000 / clock['span'])
+
+
+def estimated_error(state, now=None):
+    """
+    Seconds that the corrected RTC could be wrong by now. None if it was never synced
+    """
+    clock = state.get('clock')
+    if not clock:
+        return None
+    if now is None:
+        now = time.time()
+    return uncertainty_ppm(clock) * (now - clock['sync']) / 1000000
+
+
+def need_sync(state, now=None):
+    """
+    Check if the time should be synced with NTP
+    """
+    if now is None:
+        now = time.time()
+    error = estimated_error(state, now)
+    if error is None:
+        return True
+    return error > MAX_ERROR or now - state['clock']['sync'] > MAX_SYNC_PERIOD
+
+
+def correct(state):
+    """
+    Correct the RTC with the drift measured. Returns the seconds added
+    """
+    clock = state.get('clock')
+    if not clock or not clock.get('drift'):
+        return 0
+    now = time.time()
+    # The drift since the last correction, and what was left of the one before
+    drift = clock['drift'] * (now - clock['fixed']) / 1000000 + clock['rest']
+    correction = int(drift)
+    if abs(correction) < MIN_CORRECTION:
+        return 0
+    shift_rtc(correction)
+    clock['fixed'] = now + correction
+    # The RTC has whole seconds, keep the fraction for the next correction
+    clock['rest'] = drift - correction
+    clock['applied'] += correction
+    return correction
+
+
+def query():
+    """
+    Get the time (UTC seconds) from the first NTP server that answers. None if none does
+    """
+    # Imported here, correct() runs at every wake up and does not need the network
+    import ntptime
+    ntptime.timeout = NTP_TIMEOUT
+    for server in NTP_SERVERS:
+        ntptime.host = server
+        try:
+            return ntptime.time()
+        except (OSError, OverflowError) as e:
+            print('NTP server {} did not answer {}{}'.format(server, type(e).__name__, e))
+    return None
+
+
+def sync(state):
+    """
+    Set the RTC from NTP and measure the drift since the last sync.
+    Returns False if no server answered
+    """
+    ntp_time = query()
+    if ntp_time is None:
+        return False
+    rtc_time = time.time()
+    clock = state.get('clock')
+    drift = None
+    span = 0
+    if clock and rtc_time - clock['applied'] > clock['sync']:
+        # What the RTC drifted, including what was already corrected, in the
+        # time it ran by itself
+        span = rtc_time - clock['applied'] - clock['sync']
+        drift = (ntp_time - rtc_time + clock['applied']) * 1000000 / span
+        if clock.get('drift') is not None:
+            # Average with the previous measures, by how long they were
+            drift = (clock['drift'] * clock['span'] + drift * span) / (clock['span'] + span)
+            span = min(clock['span'] + span, MAX_DRIFT_SPAN)
+    set_rtc(ntp_time)
+    state['clock'] = {'sync': ntp_time, 'fixed': ntp_time, 'drift': drift, 'span': span, 'applied': 0, 'rest': 0}
+    return True
@@ -0,0 +1,126 @@
+# Estenopeica-control
+# First part of every wake up: load the state from the RTC memory and, if
+# there is nothing to do yet, go back to deep sleep before importing and
+# setting up anything else. After a reset it closes the pinholes that were
+# open. Otherwise program.py goes on with what this leaves in state.
+
+import time
+# Start of the program, to measure how long the boot takes
+boot_started = time.ticks_ms()
+import machine
+import rtcstate
+import schedule
+import timekeeping
+from config import *
+
+def known_state(state):
+    """
+    Check that the state in RTC memory is of this program and these cameras
+    """
+    last_pic = state.get('last_pic')
+    return 'next_report' in state and isinstance(last_pic, list) and len(last_pic) == len(CAMERAS)
+
+def get_next_opening_seconds(state, actual_time_seconds, camera=0):
+    """
+    Given a certain time, get the time in seconds of the next opening of a
+    camera (its index) not taken yet.
+    It is in the past if we are late for it, but less than OPENING_GRACE.
+    """
+    since = max(actual_time_seconds - OPENING_GRACE, state['last_pic'][camera] + 1)
+    return schedule.next_opening(since, CAMERAS[camera]['schedules'])
+
+def due_openings(state, actual_time_seconds, skip=()):
+    """
+    The openings of the cameras (but the ones in skip) that are due, as
+    (camera index, opening), and the time of the next opening of the others.
+    None if there is no other
+    """
+    due = []
+    opening_seconds = None
+    for index in range(len(CAMERAS)):
+        if index in skip:
+            continue
+        opening = get_next_opening_seconds(state, actual_time_seconds, index)
+        if opening <= actual_time_seconds:
+            due.append((index, opening))
+        elif opening_seconds is None or opening < opening_seconds:
+            opening_seconds = opening
+    return due, opening_seconds
+
+def get_next_wake_seconds(state, actual_time_seconds):
+    """
+    Get the time in seconds of the next thing to do: a report or an opening
+    of any camera that was not done yet.
+    """
+    wake = state.get('next_report', actual_time_seconds)
+    for camera in range(len(CAMERAS)):
+        wake = min(wake, get_next_opening_seconds(state, actual_time_seconds, camera))
+    return wake
+
+def deep_sleep(state):
+    """
+    Save the state and put the esp32 in deep sleep until the next thing to do.
+    The program starts again from main.py when it wakes up.
+    """
+    actual_time_seconds = time.time() + UTC_OFFSET
+    sleep_time = max(get_next_wake_seconds(state, actual_time_seconds) - actual_time_seconds, 1)
+    rtcstate.save(state)
+    machine.deepsleep(sleep_time * 1000)
+
+def recover_shutters(state):
+    """
+    The esp32 was reset with pinholes open. Close them straight away, one at
+    a time, and decide if each exposure counts or has to be finished later
+    """
+    import servoctl
+    topup = []
+    recovered = []
+    for camera, opening, opened, open_time in state.pop('shutter'):
+        door = servoctl.Servo(CAMERAS[camera]['pin'])
+        door.move(CAMERAS[camera]['closed'])
+        door.wait()
+        actual_time_seconds = time.time() + UTC_OFFSET
+        exposed = min(actual_time_seconds - opened, open_time)
+        counted = exposed >= open_time - RESUME_MARGIN or actual_time_seconds - opening > OPENING_GRACE
+        if counted:
+            state['last_pic'][camera] = opening
+            state['pics'] += 1
+        else:
+            # Seconds it was already open. See open_shutters()
+            topup.append([camera, opening, exposed])
+        recovered.append([camera, opening, exposed, counted])
+    if topup:
+        state['topup'] = topup
+    state['recovered'] = recovered
+    rtcstate.save(state)
+
+# ---
+## Fast path after waking up from deep sleep
+# The RTC kept the time and the state of the loop while sleeping. If there is
+# nothing to do yet, go back to sleep before setting up anything.
+state = rtcstate.load()
+resuming = DEEP_SLEEP and machine.reset_cause() == machine.DEEPSLEEP_RESET and known_state(state)
+# After a crash, the watchdog or the reset button the RTC memory still has
+# the state, and the RTC the time. Go on from it
+recovering = not resuming and known_state(state)
+if resuming:
+    state['wakes'] = state.get('wakes', 0) + 1
+    # Fix the drift of the RTC while sleeping, measured in the NTP syncs
+    timekeeping.correct(state)
+    remaining = get_next_wake_seconds(state, time.time() + UTC_OFFSET) - (time.time() + UTC_OFFSET)
+    if remaining > WAKE_MARGIN:
+        state['quick_wake_ms'] = time.ticks_diff(time.ticks_ms(), boot_started)
+        deep_sleep(state)
+    elif remaining > 0:
+        # Woke up a bit early, the RTC clock is not perfect while sleeping
+        time.sleep(remaining)
+elif recovering:
+    timekeeping.correct(state)
+    # Pinholes may have been open, close them before anything else
+    if 'shutter' in state:
+        recover_shutters(state)
+else:
+    state = {'next_report': 0, 'last_pic': [0] * len(CAMERAS), 'wakes': 0, 'pics': 0, 'reports': 0}
+# From here, if the program is stuck or ends by an error the watchdog
+# resets the esp32
+wdt = machine.WDT(timeout=WDT_TIMEOUT)
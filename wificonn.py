@@ -0,0 +1,208 @@
+# Estenopeica-control
+# WiFi connection manager.
+#
+# Connecting is what takes most of the time (and battery) of a wake up, so
+# the access point (BSSID and channel) and the IP configuration of the last
+# good connection are cached in the flash. The next connection first tries
+# to go straight to that access point with a static IP, without scanning and
+# without DHCP. If that fails it scans, connects to the strongest access
+# point of the network, and retries with exponential backoff. The cache has
+# no credentials, they are always read from CREDENTIALS_FILE.
+#
+# The esp32 associates in the background, so begin() starts the connection
+# to the cached access point and returns straight away. The program can set
+# up the rest of the hardware meanwhile, and connect() then waits for it.
+#
+# The latency of every attempt is kept in `attempts`. While waiting it calls
+# `feed`, if set, to keep a watchdog fed.
+
+import json
+import time
+import network
+import ubinascii
+
+# File with the credentials, see the README
+CREDENTIALS_FILE = 'wifi-credentials.txt'
+# File in the flash with the last good connection
+CACHE_FILE = 'wifi-cache.json'
+# How long to wait (ms) for the fast connection with the cached access point
+FAST_TIMEOUT = 3000
+# How long to wait (ms) for each connection after a scan
+ATTEMPT_TIMEOUT = 15000
+# How often (ms) to check if we are connected
+POLL_PERIOD = 50
+# Wait between failed attempts (seconds), doubled after each one
+BACKOFF_START = 1
+BACKOFF_MAX = 300
+
+# (kind, milliseconds, connected) of each attempt. kind is 'fast' or 'scan'
+attempts = []
+# Called while waiting, like the feed() of a machine.WDT
+feed = None
+# (cache, ticks_ms when it started) of the fast connection started by begin()
+started = None
+
+
+def read_credentials():
+    """
+    Read the ssid and password from the credentials file
+    """
+    with open(CREDENTIALS_FILE) as cred_f:
+        ssid = cred_f.readline().split('=')[1].replace("'", "").strip()
+        password = cred_f.readline().split('=')[1].replace("'", "").strip()
+    return ssid, password
+
+
+def load_cache():
+    """
+    Get the last good connection. None if there is none
+    """
+    try:
+        with open(CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if 'password' in cache:
+        # Written by an older version, with the credentials
+        cache.pop('ssid', None)
+        cache.pop('password')
+        save_cache(cache)
+    return cache
+
+
+def save_cache(cache):
+    """
+    Save the last good connection
+    """
+    with open(CACHE_FILE, 'w') as f:
+        json.dump(cache, f)
+
+
+def wait_connected(wlan, timeout):
+    """
+    Wait until connected, for at most timeout milliseconds
+    """
+    start = time.ticks_ms()
+    while not wlan.isconnected():
+        if time.ticks_diff(time.ticks_ms(), start) > timeout:
+            return False
+        if feed:
+            feed()
+        time.sleep_ms(POLL_PERIOD)
+    return True
+
+
+def backoff_sleep(seconds):
+    """
+    Wait between attempts, one second at a time to call feed
+    """
+    for _ in range(seconds):
+        if feed:
+            feed()
+        time.sleep(1)
+
+
+def fast_start(wlan, cache, ssid, password):
+    """
+    Start connecting to the cached access point with the cached IP
+    configuration. Does not wait
+    """
+    try:
+        # Not all the firmwares let a station choose the channel
+        wlan.config(channel=cache['channel'])
+    except (OSError, ValueError, TypeError):
+        pass
+    wlan.ifconfig(tuple(cache['ifconfig']))
+    wlan.connect(ssid, password, bssid=ubinascii.unhexlify(cache['bssid']))
+
+
+def fast_finish(wlan, start):
+    """
+    Wait for the connection started by fast_start() at the time start
+    """
+    connected = wait_connected(wlan, FAST_TIMEOUT - time.ticks_diff(time.ticks_ms(), start))
+    attempts.append(('fast', time.ticks_diff(time.ticks_ms(), start), connected))
+    if not connected:
+        # The access point or the IP changed. Go back to DHCP
+        wlan.disconnect()
+        wlan.ifconfig('dhcp')
+    return connected
+
+
+def scan_connect(wlan, ssid, password, cache):
+    """
+    Scan for the strongest access point of the network and connect to it.
+    Cache the connection if it worked
+    """
+    start = time.ticks_ms()
+    best = None
+    for found in wlan.scan():
+        # (ssid, bssid, channel, RSSI, security, hidden)
+        if found[0].decode() == ssid and (best is None or found[3] > best[3]):
+            best = found
+    if best:
+        wlan.connect(ssid, password, bssid=best[1])
+    else:
+        # Maybe a hidden network
+        wlan.connect(ssid, password)
+    connected = wait_connected(wlan, ATTEMPT_TIMEOUT)
+    attempts.append(('scan', time.ticks_diff(time.ticks_ms(), start), connected))
+    if connected and best:
+        new_cache = {'bssid': ubinascii.hexlify(best[1]).decode(), 'channel': best[2],
+                     'ifconfig': list(wlan.ifconfig())}
+        # Only write the flash if something changed
+        if new_cache != cache:
+            save_cache(new_cache)
+    elif not connected:
+        wlan.disconnect()
+    return connected
+
+
+def begin():
+    """
+    Start the connection to the cached access point, if there is one, and
+    return. connect() finishes it
+    """
+    global started
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    if wlan.isconnected() or started:
+        return
+    cache = load_cache()
+    started = (cache, time.ticks_ms())
+    if cache:
+        fast_start(wlan, cache, *read_credentials())
+
+
+def connect(max_attempts=None):
+    """
+    Connect to the WiFi. Tries the cached access point first, then scans.
+    Tries max_attempts times after the fast connection, forever if None.
+    Returns the WLAN interface, or None if it could not connect
+    """
+    global started
+    begin()
+    wlan = network.WLAN(network.STA_IF)
+    cache, start = started or (None, None)
+    started = None
+    if cache and fast_finish(wlan, start):
+        return wlan
+    if wlan.isconnected():
+        return wlan
+    ssid, password = read_credentials()
+    backoff = BACKOFF_START
+    attempt = 0
+    while max_attempts is None or attempt < max_attempts:
+        attempt += 1
+        if scan_connect(wlan, ssid, password, cache):
+            return wlan
+        backoff_sleep(backoff)
+        backoff = min(backoff * 2, BACKOFF_MAX)
+    return None
+
+
+def connect_time():
+    """
+    Total milliseconds spent in the connection attempts
+    """
+    return sum(attempt[1] for attempt in attempts)